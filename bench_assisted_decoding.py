@@ -0,0 +1,108 @@
+"""
+このファイルでは「時」「とき」の判定プロンプトに対する生成速度を、ドラフトモデルの有無で比較します。
+model/draft にトークナイザーが共通の小型モデルを配置してから実行してください（python model_download.py --draft REPO_ID）。
+
+使い方:
+    python bench_assisted_decoding.py                # 組み込みの例文で計測
+    python bench_assisted_decoding.py sentences.txt  # 1行に1文のファイルで計測
+
+計測項目:
+    ・生成速度（トークン/秒）
+    ・受理率：ドラフトモデルが提案したトークンのうち本体のモデルが採用した割合
+      （本体の1回の推論で「採用されたドラフトのトークン数 + 1」トークンが確定することから、
+        生成トークン数 - 本体の推論回数 を採用数、ドラフトモデルの推論回数を提案数として求める）
+    ・貪欲法での生成結果がドラフトモデルの有無で一致するか
+"""
+
+import sys
+import time
+
+import torch
+
+from model_download import get_tokenizer, get_model, get_draft_model
+from process_llm import build_toki_prompt
+
+# 組み込みの例文
+SAMPLE_SENTENCES = [
+    "この時，修復作業を3日間と仮定すると，総放出量のうち希ガス約55％が排気口放出に変わることとなる。",
+    "異常を検知した時は，運転員が直ちに原子炉を停止する。",
+    "荷物が多いときにはタクシーを使う。",
+    "母が私を呼んだとき、私は数学を勉強していた。",
+]
+
+# 1つのプロンプトで生成する最大トークン数
+MAX_NEW_TOKENS = 512
+
+
+def count_forward_calls(model):
+    """
+    モデルの推論（forward）の回数を数えるフックを登録し、回数を保持するリストを返す
+    """
+    calls = [0]
+
+    def hook(module, args, output):
+        calls[0] += 1
+
+    model.register_forward_hook(hook)
+    return calls
+
+
+def generate(model, tokenizer, prompt, assistant_model=None):
+    """
+    貪欲法で生成し、(生成したトークン列, 処理時間) を返す
+    """
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    output = model.generate(**inputs, do_sample=False, max_new_tokens=MAX_NEW_TOKENS, assistant_model=assistant_model)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    return output[0, inputs["input_ids"].shape[1]:], elapsed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as sentence_file:
+            sentences = [line.strip() for line in sentence_file if line.strip()]
+    else:
+        sentences = SAMPLE_SENTENCES
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    tokenizer = get_tokenizer()
+    model = get_model().to(device)
+    draft_model = get_draft_model().to(device)
+    model_calls = count_forward_calls(model)
+    draft_calls = count_forward_calls(draft_model)
+
+    results = {"通常の生成": [0, 0.0], "支援付き生成": [0, 0.0]}
+    accepted = 0
+    proposed = 0
+    mismatches = 0
+
+    for sentence in sentences:
+        prompt = build_toki_prompt(sentence)
+
+        baseline, elapsed = generate(model, tokenizer, prompt)
+        results["通常の生成"][0] += len(baseline)
+        results["通常の生成"][1] += elapsed
+
+        model_calls[0] = 0
+        draft_calls[0] = 0
+        assisted, elapsed = generate(model, tokenizer, prompt, assistant_model=draft_model)
+        results["支援付き生成"][0] += len(assisted)
+        results["支援付き生成"][1] += elapsed
+        accepted += max(0, len(assisted) - model_calls[0])
+        proposed += draft_calls[0]
+
+        if not torch.equal(baseline, assisted):
+            mismatches += 1
+            print(f"警告: 生成結果が一致しません: {sentence}")
+
+    for label, (tokens, elapsed) in results.items():
+        print(f"{label}: {tokens}トークン, {elapsed:.1f}秒, {tokens / elapsed:.1f}トークン/秒")
+    speedup = (results["支援付き生成"][0] / results["支援付き生成"][1]) / (results["通常の生成"][0] / results["通常の生成"][1])
+    print(f"速度比: {speedup:.2f}倍")
+    print(f"受理率: {accepted / proposed:.1%}（採用 {accepted} / 提案 {proposed}）" if proposed else "受理率: 計測できませんでした")
+    print(f"生成結果の一致: {len(sentences) - mismatches}/{len(sentences)}")
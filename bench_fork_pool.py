@@ -0,0 +1,89 @@
+"""
+このファイルではワーカープロセスの起動方法ごとに、起動時間とメモリ使用量を計測します。
+・spawn: 各ワーカーがprocess.pyを読み込み、MeCabとspaCyをそれぞれ初期化する
+・fork : 親プロセスで読み込んだMeCabとspaCyをコピーオンライトで共有する（fork_pool.py）
+
+メモリ使用量は /proc/<pid>/smaps_rollup から取得する（Linuxのみ）
+・PSS: 共有ページをプロセス数で按分したサイズ。全ワーカーの合計が実際の使用量に相当する
+・USS: そのプロセスだけが使用しているページ（Private_Clean + Private_Dirty）のサイズ
+
+使い方:
+    python bench_fork_pool.py              # ワーカー数 1/2/4/8
+    python bench_fork_pool.py 1 4 16       # ワーカー数を指定
+"""
+
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fork_pool
+
+# 計測するワーカー数
+WORKER_COUNTS = [1, 2, 4, 8]
+
+# ワーカーが実際にMeCabとspaCyを使用した状態で計測するための文
+SAMPLE_TEXT = "異常を検知した時は，運転員が直ちに原子炉を停止するほか，他の系統の状態も確認する。"
+
+
+def warm_up(_):
+    """
+    ワーカーで1回解析を行い、プロセスIDを返す（全ワーカーに行き渡るよう少し待つ）
+    """
+    import os
+    import process
+
+    process.analyze_chunk([SAMPLE_TEXT])
+    time.sleep(0.5)
+    return os.getpid()
+
+
+def memory_of(pid):
+    """
+    プロセスのPSSとUSS（MB）を返す
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    pss = values.get("Pss", 0) / 1024
+    uss = (values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)) / 1024
+    return pss, uss
+
+
+def measure(start_method, workers):
+    """
+    プールを起動して全ワーカーで1回ずつ解析を行うまでの時間と、ワーカーのメモリ使用量を計測する
+    """
+    start = time.perf_counter()
+    if start_method == "fork":
+        executor = fork_pool.create_fork_pool(workers)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pids = set(executor.map(warm_up, range(workers)))
+    startup = time.perf_counter() - start
+
+    memories = [memory_of(pid) for pid in pids]
+    if start_method == "fork":
+        fork_pool.release_fork_pool(executor)
+    else:
+        executor.shutdown()
+
+    total_pss = sum(pss for pss, _ in memories)
+    average_uss = sum(uss for _, uss in memories) / len(memories)
+    print(f"{start_method:5s} ワーカー数 {workers:2d}: 起動 {startup:6.2f}秒, PSS合計 {total_pss:8.1f}MB, USS平均 {average_uss:7.1f}MB/ワーカー")
+
+
+if __name__ == "__main__":
+    worker_counts = [int(arg) for arg in sys.argv[1:]] or WORKER_COUNTS
+
+    # 親プロセスでの読み込み（forkの場合はこの1回だけで済む）
+    start = time.perf_counter()
+    fork_pool.preload()
+    print(f"親プロセスでのモデル読み込み: {time.perf_counter() - start:.2f}秒")
+
+    for workers in worker_counts:
+        for start_method in ["spawn", "fork"]:
+            measure(start_method, workers)
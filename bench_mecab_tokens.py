@@ -0,0 +1,97 @@
+"""
+このファイルでは形態素解析結果の取り出し方の処理時間を比較します。
+・-Ochasen形式の出力文字列を行・タブで分割してタプルを作る方法（従来の方法）
+・MeCabのノードAPIからMecabTokenを作成する方法（tokenize_nodes）
+・-Ochasen形式の出力を1回で取得してMecabTokenを作成する方法（mecab_tokens.tokenize）
+
+使い方:
+    python bench_mecab_tokens.py
+"""
+
+import time
+
+import MeCab  # MeCabを使用した形態素解析
+from mecab_tokens import MecabToken, tokenize
+
+# 計測に用いる文（仕様書の条文を想定し、「時」「とき」「他」「外」を含む文を繰り返す）
+SAMPLE_TEXT = (
+    "この時，修復作業を3日間と仮定すると，第2.1.2-9表の条件で評価した総放出量のうち，"
+    "希ガス約55％，よう素約75％が非常用ガス処理系の修復作業によって排気口放出に変わることとなる。"
+    "荷物が多いときにはタクシーを使うほか，他の手段も検討する。"
+)
+
+# 繰り返し回数
+REPEAT = 2000
+
+# 文頭・文末を表すノードの種類（MeCabのMECAB_BOS_NODE, MECAB_EOS_NODE）
+BOS_EOS_STATS = (2, 3)
+
+
+def parse_chasen(tagger, text):
+    """
+    従来の方法：-Ochasen形式の出力文字列を分割して (表層形, 読み仮名, 品詞) を取り出す
+    """
+    tokens = []
+    for line in tagger.parse(text).splitlines():
+        if line == 'EOS':
+            continue
+        parts = line.split('\t')
+        if len(parts) < 4:
+            continue
+        tokens.append((parts[0], parts[1], parts[3]))
+    return tokens
+
+
+def tokenize_nodes(tagger, text):
+    """
+    MeCabのノードを順にたどり、MecabTokenのリストを返す関数（tokenizeと同じ結果を返す）
+    品詞と読み仮名はIPA辞書の素性（品詞,品詞細分類1,品詞細分類2,品詞細分類3,活用型,活用形,原形,読み,発音）から取り出す
+    未知語で読みがない場合は、ChaSen形式の出力と同じく表層形を読み仮名とする
+    """
+    tokens = []
+    cursor = 0
+    node = tagger.parseToNode(text)
+    while node:
+        if node.stat not in BOS_EOS_STATS:
+            surface = node.surface
+            features = node.feature.split(",", 8)
+            pos = "-".join([feature for feature in features[:4] if feature != "*"])
+            pronunciation = features[7] if len(features) > 7 and features[7] != "*" else surface
+
+            # MeCabが読み飛ばした空白を除いた位置を求める
+            start = text.find(surface, cursor)
+            if start == -1:
+                start = cursor
+            cursor = start + len(surface)
+
+            tokens.append(MecabToken(surface, pronunciation, pos, start, cursor))
+        node = node.next
+    return tokens
+
+
+def measure(label, func, tagger, text):
+    """
+    funcをREPEAT回実行し、1文あたりの処理時間を表示する
+    """
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(tagger, text)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed / REPEAT * 1e6:.1f}マイクロ秒/文（{REPEAT}回, 合計{elapsed:.2f}秒）")
+    return elapsed
+
+
+if __name__ == "__main__":
+    tagger = MeCab.Tagger("-Ochasen")
+
+    # すべての方法で同じ表層形・読み仮名・品詞が得られることを確認
+    expected = parse_chasen(tagger, SAMPLE_TEXT)
+    for func in [tokenize, tokenize_nodes]:
+        actual = [(token.surface, token.pronunciation, token.pos) for token in func(tagger, SAMPLE_TEXT)]
+        if expected != actual:
+            print(f"警告: {func.__name__} の解析結果が従来の方法と一致しません")
+
+    chasen_time = measure("ChaSen形式の文字列を分割（タプル）", parse_chasen, tagger, SAMPLE_TEXT)
+    node_time = measure("ノードAPI（MecabToken）", tokenize_nodes, tagger, SAMPLE_TEXT)
+    token_time = measure("ChaSen形式を1回で取得（MecabToken）", tokenize, tagger, SAMPLE_TEXT)
+    print(f"従来の方法に対する処理時間の比: ノードAPI {node_time / chasen_time:.2f}倍, tokenize {token_time / chasen_time:.2f}倍")
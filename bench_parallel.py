@@ -0,0 +1,67 @@
+"""
+このファイルでは合成した大きなdocument.xmlを用いて、ルールベースの校閲処理（process.py）の並列化の効果を計測します。
+ワーカー数ごとの処理時間と、出力（xmlとログ）がワーカー数1の場合と一致するかを表示する。
+
+使い方:
+    python bench_parallel.py                 # 2000段落、ワーカー数 1/2/4/8/16
+    python bench_parallel.py 10000 1 4 16    # 段落数とワーカー数を指定
+"""
+
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from process import process_xml
+
+# 合成する段落の文（「時」「とき」「他」「外」を含む文と含まない文を混在させる）
+SAMPLE_SENTENCES = [
+    "この時，修復作業を3日間と仮定すると，総放出量のうち希ガス約55％が排気口放出に変わることとなる。",
+    "異常を検知した時は，運転員が直ちに原子炉を停止するほか，他の系統の状態も確認する。",
+    "荷物が多いときにはタクシーを使う。",
+    "15時30分に建屋外の設備を点検する。",
+    "本章では設備の概要を示す。",
+]
+
+# 計測するワーカー数
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+
+def make_document(path, paragraphs):
+    """
+    SAMPLE_SENTENCESを繰り返した段落からなるdocument.xmlを作成する
+    """
+    with open(path, 'w', encoding='utf-8') as xml_file:
+        xml_file.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        xml_file.write('<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+        for i in range(paragraphs):
+            sentence = SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)]
+            xml_file.write(f'<w:p><w:r><w:rPr><w:sz w:val="21"/></w:rPr><w:t>{sentence}</w:t></w:r></w:p>')
+        xml_file.write('</w:body></w:document>')
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    worker_counts = [int(arg) for arg in sys.argv[2:]] or WORKER_COUNTS
+
+    work_dir = tempfile.mkdtemp()
+    source = os.path.join(work_dir, "document.xml")
+    make_document(source, paragraphs)
+
+    baseline = None
+    for workers in worker_counts:
+        outputs = [os.path.join(work_dir, f"{name}_{workers}") for name in ["document.xml", "mecab.txt", "spacy.txt"]]
+        shutil.copy(source, outputs[0])
+
+        start = time.perf_counter()
+        process_xml(outputs[0], outputs[1], outputs[2], workers=workers)
+        elapsed = time.perf_counter() - start
+
+        if baseline is None:
+            baseline = (outputs, elapsed)
+        identical = all(filecmp.cmp(expected, actual, shallow=False) for expected, actual in zip(baseline[0], outputs))
+        print(f"ワーカー数 {workers:2d}: {elapsed:.2f}秒, 速度比 {baseline[1] / elapsed:.2f}倍, 出力の一致: {'OK' if identical else 'NG'}")
+
+    shutil.rmtree(work_dir)
@@ -0,0 +1,122 @@
+"""
+このファイルでは1台のホストで複数の校閲処理を同時に実行した場合の処理速度を、resources.py によるスレッド数・ワーカー数の設定の有無で比較します。
+・設定なし: 各処理がコア数分のワーカーを起動し、torch・BLAS・OpenMPもそれぞれコア数分のスレッドを使用する
+・設定あり: 各処理が resources.configure でコアを同時に実行中の処理数で分け合う
+
+処理の内容（--workload）:
+・review: 合成した document.xml に対するルールベースの校閲処理（process.py、forkしたワーカーで並列に解析）
+・torch : torchによる行列積の繰り返し（CPUでのLLMの推論を想定）
+
+使い方:
+    python bench_resources.py                         # 同時実行数 1/2/4、review
+    python bench_resources.py 2 4 8 --workload torch  # 同時実行数を指定、torch
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import resources
+
+# 計測する同時実行数
+JOB_COUNTS = [1, 2, 4]
+
+# 1つの処理で校閲する段落数
+PARAGRAPHS = 1000
+
+# torchの処理で計算する行列の大きさと回数
+MATRIX_SIZE = 1024
+MATRIX_ITERATIONS = 50
+
+
+def run_review(workers, paragraphs):
+    """
+    合成したdocument.xmlをprocess.pyで校閲する
+    """
+    from bench_parallel import make_document
+    from process import process_xml
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        xml_path = os.path.join(work_dir, "document.xml")
+        make_document(xml_path, paragraphs)
+        process_xml(xml_path, os.path.join(work_dir, "mecab.txt"), os.path.join(work_dir, "spacy.txt"), workers=workers, start_method="fork")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run_torch():
+    """
+    torchで行列積を繰り返す
+    """
+    import torch
+
+    matrix = torch.randn(MATRIX_SIZE, MATRIX_SIZE)
+    for _ in range(MATRIX_ITERATIONS):
+        matrix = torch.tanh(matrix @ matrix)
+
+
+def run_job(scheduled, workload, paragraphs):
+    """
+    1つの校閲処理として実行する（子プロセス）
+    """
+    if scheduled:
+        workers = resources.configure(workers=os.cpu_count()).workers
+    else:
+        workers = os.cpu_count()
+
+    if workload == "torch":
+        run_torch()
+    else:
+        run_review(workers, paragraphs)
+
+
+def measure(jobs, scheduled, workload, paragraphs):
+    """
+    jobs件の処理を同時に起動し、すべて終わるまでの時間を計測する
+    """
+    env = dict(os.environ)
+    if scheduled:
+        # 同時に起動する処理がお互いを数えられるよう、同時実行数を指定する
+        env[resources.CONCURRENT_JOBS_ENV] = str(jobs)
+    else:
+        for name in resources.THREAD_ENV_VARS + [resources.CONCURRENT_JOBS_ENV]:
+            env.pop(name, None)
+
+    command = [sys.executable, __file__, "--job", "--workload", workload, "--paragraphs", str(paragraphs)]
+    if scheduled:
+        command.append("--scheduled")
+
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL) for _ in range(jobs)]
+    failed = sum(1 for process in processes if process.wait() != 0)
+    elapsed = time.perf_counter() - start
+
+    label = "設定あり" if scheduled else "設定なし"
+    status = f", 失敗: {failed}件" if failed else ""
+    print(f"同時実行数 {jobs:2d} {label}: {elapsed:7.2f}秒, {jobs / elapsed * 60:7.2f}件/分{status}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="同時に実行した校閲処理の処理速度を、スレッド数・ワーカー数の設定の有無で比較します。")
+    parser.add_argument("jobs", nargs="*", type=int, default=JOB_COUNTS, help="同時実行数")
+    parser.add_argument("--workload", choices=["review", "torch"], default="review", help="処理の内容")
+    parser.add_argument("--paragraphs", type=int, default=PARAGRAPHS, help="reviewで校閲する段落数")
+    parser.add_argument("--job", action="store_true", help=argparse.SUPPRESS)  # 1つの処理を実行する子プロセス用
+    parser.add_argument("--scheduled", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        run_job(args.scheduled, args.workload, args.paragraphs)
+        sys.exit(0)
+
+    print(f"使用できるコア数: {resources.available_cores()}, 空きメモリ: {resources.available_memory_gb():.1f}GB")
+    for jobs in args.jobs:
+        default = measure(jobs, False, args.workload, args.paragraphs)
+        scheduled = measure(jobs, True, args.workload, args.paragraphs)
+        print(f"同時実行数 {jobs:2d}: 速度比 {default / scheduled:.2f}倍")
@@ -7,7 +7,7 @@ import shutil
 def delete_files_and_directories():
     # 削除対象のディレクトリとファイル
     directories = ['xml', 'xml_new']
-    files = ['mecab_analysis_log.txt', 'spacy_analysis_log.txt']
+    files = ['mecab_analysis_log.txt', 'spacy_analysis_log.txt', 'scan_report.json', 'edit_log.json']
 
     # ディレクトリの削除
     for directory in directories:
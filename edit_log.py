@@ -0,0 +1,374 @@
+"""
+このファイルでは、校閲処理の結果を「編集ログ」として保持し、document.xml の書き出し時にまとめて反映します。
+解析の段階ではxmlの木を書き換えず、変換箇所ごとに (段落番号, <w:r>番号, 文字位置の範囲, 置き換える文字列, ハイライト色) を記録する。
+記録は列ごとの配列（array）に保持するため、変換箇所ごとに<w:r>・<w:rPr>・<w:highlight>・<w:t>要素を作成するより使用メモリが少ない。
+
+書き出しは元の document.xml を先頭から段落ごとに読み込み、編集ログの変換を反映してすぐに出力する（文書全体の木を保持しない）。
+編集ログはファイルに保存できるため、解析をやり直さずにハイライト色だけを変えた文書を作り直せる。
+
+段落番号: 文書内のすべての<w:p>要素を文書の順に数えた番号（root.iter('{...}p') の順）
+<w:r>番号: 段落に直接属する（入れ子の段落に含まれない）テキストをもつ<w:r>要素を文書の順に数えた番号
+テキストボックス（<w:drawing>・<mc:AlternateContent>内の<w:txbxContent>）の段落は、それを含む段落とは別の段落として数え、
+テキストボックスを含む<w:r>は変換の対象にしない（テキストボックスのテキストを自身のテキストとして扱わないため）
+文字位置: <w:r>内のすべての<w:t>要素のテキストを結合した文字列上の位置
+
+使い方（保存した編集ログから、ハイライト色を変えて文書を作り直す）:
+    python edit_log.py xml/word/document.xml edit_log.json xml_new/word/document.xml --style red=magenta,yellow=none
+"""
+
+import copy
+import json
+import os
+from array import array
+from collections import namedtuple
+from lxml import etree as ET  # lxmlを使用
+
+# 名前空間の定義
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = f"{{{W_NAMESPACE}}}"
+
+# <w:t>の前後の空白を保持するための属性（xml:space）
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# 変換箇所1件
+# paragraph: 段落番号, run: <w:r>番号, start, end: <w:r>内の文字位置の範囲, replacement: 置き換える文字列, color: ハイライト色
+Edit = namedtuple("Edit", ["paragraph", "run", "start", "end", "replacement", "color"])
+
+
+class EditLog:
+    """
+    変換箇所を列ごとの配列で保持する編集ログ
+    置き換える文字列とハイライト色は種類が少ないため、文字列表の番号として保持する
+    変換箇所を追加する順は問わない（入れ子の段落は外側の段落より先に読み終えるため、段落番号の順にならない場合がある）
+    書き出し時に sorted_indices で段落番号, <w:r>番号, 開始位置の順に並べる
+    """
+
+    def __init__(self):
+        self.paragraphs = array("I")
+        self.runs = array("I")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.replacements = array("H")
+        self.colors = array("H")
+        self.strings = []
+        self.string_ids = {}
+
+    def string_id(self, text):
+        if text not in self.string_ids:
+            self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_ids[text]
+
+    def add(self, paragraph, run, start, end, replacement, color):
+        self.paragraphs.append(paragraph)
+        self.runs.append(run)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.replacements.append(self.string_id(replacement))
+        self.colors.append(self.string_id(color))
+
+    def add_run(self, paragraph, run, edits):
+        """
+        1つの<w:r>の変換箇所 [(開始位置, 終了位置, 置き換える文字列, ハイライト色), ...] を開始位置の順に追加する
+        """
+        for start, end, replacement, color in sorted(edits):
+            self.add(paragraph, run, start, end, replacement, color)
+
+    def __len__(self):
+        return len(self.paragraphs)
+
+    def __getitem__(self, i):
+        return Edit(self.paragraphs[i], self.runs[i], self.starts[i], self.ends[i],
+                    self.strings[self.replacements[i]], self.strings[self.colors[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sorted_indices(self):
+        """
+        変換箇所の番号を段落番号, <w:r>番号, 開始位置の順に並べて返す
+        """
+        return array("I", sorted(range(len(self)), key=lambda i: (self.paragraphs[i], self.runs[i], self.starts[i])))
+
+    def save(self, path):
+        """
+        編集ログをJSON形式で保存する
+        """
+        with open(path, 'w', encoding='utf-8') as log_file:
+            json.dump({
+                "paragraph": self.paragraphs.tolist(),
+                "run": self.runs.tolist(),
+                "start": self.starts.tolist(),
+                "end": self.ends.tolist(),
+                "replacement": self.replacements.tolist(),
+                "color": self.colors.tolist(),
+                "strings": self.strings,
+            }, log_file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """
+        保存した編集ログを読み込む
+        """
+        with open(path, encoding='utf-8') as log_file:
+            data = json.load(log_file)
+        edit_log = cls()
+        edit_log.paragraphs.extend(data["paragraph"])
+        edit_log.runs.extend(data["run"])
+        edit_log.starts.extend(data["start"])
+        edit_log.ends.extend(data["end"])
+        edit_log.replacements.extend(data["replacement"])
+        edit_log.colors.extend(data["color"])
+        edit_log.strings = data["strings"]
+        edit_log.string_ids = {text: i for i, text in enumerate(edit_log.strings)}
+        return edit_log
+
+
+def map_edits(edits, positions, offset=0):
+    """
+    変換後のテキスト上の変換箇所を、positions（変換後のテキストの各文字に対応する元のテキスト上の位置）を用いて
+    元のテキスト上の位置に直し、offsetを加えて返す関数
+    """
+    return [
+        (offset + positions[start], offset + positions[end - 1] + 1, replacement, color)
+        for start, end, replacement, color in edits
+    ]
+
+
+def paragraph_runs(paragraph):
+    """
+    段落に直接属し、テキストをもつ<w:r>要素を文書の順に返す関数
+    テキストボックスなどの入れ子の段落を含む<w:r>は返さない
+    """
+    runs = []
+    for run in paragraph.iter(W + "r"):
+        if next(run.iterancestors(W + "p"), None) is not paragraph:
+            continue  # 入れ子の段落の<w:r>
+        if run.find(".//" + W + "p") is not None:
+            continue  # テキストボックスを含む<w:r>
+        if any(t.text for t in run.iter(W + "t")):
+            runs.append(run)
+    return runs
+
+
+def run_text(run):
+    """
+    <w:r>内のすべての<w:t>要素のテキストを結合して返す関数
+    """
+    return "".join(t.text for t in run.iter(W + "t") if t.text)
+
+
+def iter_paragraph_runs(source):
+    """
+    document.xmlを先頭から順に読み込み、段落ごとに (段落番号, [<w:r>のテキスト, ...]) を返す関数
+    段落は読み終えた順に返すため、入れ子の段落は外側の段落より先に返す
+    読み終えた段落は削除し、文書全体の木をメモリに保持しない
+    """
+    open_paragraphs = []  # 読み込み中の段落番号（表やテキストボックス内の段落は入れ子になる）
+    paragraph_count = 0
+
+    for event, paragraph in ET.iterparse(source, events=("start", "end"), tag=W + "p"):
+        if event == "start":
+            open_paragraphs.append(paragraph_count)
+            paragraph_count += 1
+            continue
+
+        yield open_paragraphs.pop(), [run_text(run) for run in paragraph_runs(paragraph)]
+
+        # 入れ子の外側の段落まで読み終えたら、読み込み済みの要素を削除
+        if not open_paragraphs:
+            paragraph.clear(keep_tail=True)
+            while paragraph.getprevious() is not None:
+                del paragraph.getparent()[0]
+
+
+def create_text_element(parent, text):
+    """
+    <w:t>要素を作成する関数
+    前後に空白がある場合は xml:space="preserve" を付与する（付与しないとWordは前後の空白を取り除く）
+    """
+    text_element = ET.SubElement(parent, W + 't')
+    text_element.text = text
+    if text and (text[0].isspace() or text[-1].isspace()):
+        text_element.set(XML_SPACE, "preserve")
+    return text_element
+
+
+def create_highlight(original_rpr, text, color):
+    """
+    新しい <w:r> 要素を作成し、指定された色でハイライトを適用した <w:t> を含む。
+    元の <w:rPr> 要素をそのままコピーして適用し、ハイライトを追加する。
+    """
+    new_run = ET.Element(W + 'r')
+
+    if original_rpr is not None:
+        # 元の <w:rPr> 要素を深くコピー
+        new_rpr = copy.deepcopy(original_rpr)
+        new_run.append(new_rpr)
+    else:
+        # 元の <w:rPr> がない場合でもハイライトを追加
+        new_rpr = ET.SubElement(new_run, W + 'rPr')
+
+    # ハイライトの要素を追加
+    highlight_elem = ET.SubElement(new_rpr, W + 'highlight')
+    highlight_elem.set(W + 'val', color)
+
+    # 新しい <w:t> 要素を追加
+    create_text_element(new_run, text)
+
+    return new_run
+
+
+def create_plain_run(original_rpr, text):
+    """
+    元の<w:rPr>を保持しつつ、<w:r>要素を複製
+    """
+    plain_run = ET.Element(W + 'r')
+    if original_rpr is not None:
+        plain_rpr = copy.deepcopy(original_rpr)
+        plain_run.append(plain_rpr)
+    create_text_element(plain_run, text)
+    return plain_run
+
+
+def apply_run_edits(run, edits, style=None):
+    """
+    <w:r>要素を、変換箇所で切り分けてハイライトを追加した<w:r>要素に置き換える関数
+    styleはハイライト色の置き換え表（{"red": "magenta"} など。Noneを指定した色はハイライトしない）
+    """
+    original_rpr = run.find(W + 'rPr')  # 元の<w:rPr>情報を取得
+    text = run_text(run)
+
+    new_elements = []
+    current_position = 0
+    for edit in edits:
+        if edit.start < current_position:
+            continue  # 重なる変換箇所は先のものを優先
+
+        # ハイライトされない部分を追加
+        if current_position < edit.start:
+            new_elements.append(create_plain_run(original_rpr, text[current_position:edit.start]))
+
+        # ハイライトされた部分を追加
+        color = style.get(edit.color, edit.color) if style else edit.color
+        if color is None:
+            new_elements.append(create_plain_run(original_rpr, edit.replacement))
+        else:
+            new_elements.append(create_highlight(original_rpr, edit.replacement, color))
+        current_position = edit.end
+
+    # 残りの部分を追加
+    if current_position < len(text):
+        new_elements.append(create_plain_run(original_rpr, text[current_position:]))
+
+    # 元の要素を削除して新しい要素を追加
+    parent = run.getparent()
+    for new_element in new_elements:
+        parent.insert(parent.index(run), new_element)
+    parent.remove(run)
+
+
+def split_tag(elem, nsmap=None):
+    """
+    要素の開始タグと終了タグをバイト列で返す関数（子要素・テキストは含めない）
+    """
+    shell = ET.Element(elem.tag, dict(elem.attrib), nsmap=nsmap)
+    shell.append(ET.Comment("split"))
+    start_tag, end_tag = ET.tostring(shell, encoding="utf-8").split(b"<!--split-->")
+    return start_tag, end_tag
+
+
+def strip_root_namespaces(serialized, root_namespaces):
+    """
+    要素ごとに書き出した際に先頭のタグに付与される、ルート要素で宣言済みの名前空間の宣言を取り除く関数
+    """
+    tag_end = serialized.index(b">")
+    start_tag = serialized[:tag_end]
+    for declaration in root_namespaces:
+        start_tag = start_tag.replace(declaration, b"", 1)
+    return start_tag + serialized[tag_end:]
+
+
+def write_document(source, output_path, edit_log, style=None):
+    """
+    元の document.xml（ファイルパスまたはファイルオブジェクト）を先頭から読み込み、編集ログの変換を反映して output_path に書き出す関数
+    <w:body>の直下の要素（段落・表など）ごとに、含まれる段落に変換を反映して書き出し、書き出した要素は削除する
+    output_path は source と同じファイルでもよい（一時ファイルに書き出してから置き換える）
+    """
+    temp_path = output_path + ".tmp"
+    containers = [W + "document", W + "body"]  # 開始タグと終了タグを別々に書き出す要素
+    root_namespaces = []
+    end_tags = []
+    paragraph_index = 0
+    order = edit_log.sorted_indices()  # 変換箇所の番号（段落番号の順）
+    cursor = 0  # 次に反映する変換箇所のorder上の位置
+
+    with open(temp_path, 'wb') as output_file:
+        output_file.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if elem.tag in containers:
+                if event == "start":
+                    if not root_namespaces:
+                        # ルート要素の名前空間の宣言は開始タグにまとめて書き出す
+                        start_tag, end_tag = split_tag(elem, elem.nsmap)
+                        root_namespaces = [f' xmlns:{prefix}="{uri}"'.encode() if prefix else f' xmlns="{uri}"'.encode() for prefix, uri in elem.nsmap.items()]
+                    else:
+                        start_tag, end_tag = split_tag(elem, elem.nsmap)
+                        start_tag = strip_root_namespaces(start_tag, root_namespaces)
+                    output_file.write(start_tag)
+                    end_tags.append(end_tag)
+                else:
+                    output_file.write(end_tags.pop())
+                continue
+
+            parent = elem.getparent()
+            if event == "start" or parent is None or parent.tag not in containers:
+                continue
+
+            # <w:body>直下の要素を読み終えたら、含まれる段落に変換を反映して書き出す
+            for paragraph in list(elem.iter(W + "p")):
+                if cursor < len(order) and edit_log.paragraphs[order[cursor]] == paragraph_index:
+                    runs = paragraph_runs(paragraph)
+                    while cursor < len(order) and edit_log.paragraphs[order[cursor]] == paragraph_index:
+                        run_index = edit_log.runs[order[cursor]]
+                        run_edits = []
+                        while cursor < len(order) and edit_log.paragraphs[order[cursor]] == paragraph_index and edit_log.runs[order[cursor]] == run_index:
+                            run_edits.append(edit_log[order[cursor]])
+                            cursor += 1
+                        apply_run_edits(runs[run_index], run_edits, style)
+                paragraph_index += 1
+
+            output_file.write(strip_root_namespaces(ET.tostring(elem, encoding="utf-8"), root_namespaces))
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    os.replace(temp_path, output_path)
+
+
+def parse_style(text):
+    """
+    「red=magenta,yellow=none」形式のハイライト色の置き換え表を辞書にする関数（noneはハイライトしない）
+    """
+    style = {}
+    for item in text.split(","):
+        if item.strip():
+            color, new_color = item.split("=")
+            style[color.strip()] = None if new_color.strip().lower() == "none" else new_color.strip()
+    return style
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="保存した編集ログを元のdocument.xmlに反映し、校閲後のdocument.xmlを作成します。")
+    parser.add_argument("source", help="元のdocument.xml（例: xml/word/document.xml）")
+    parser.add_argument("edit_log", help="編集ログ（例: edit_log.json）")
+    parser.add_argument("output", help="書き出すdocument.xml（例: xml_new/word/document.xml）")
+    parser.add_argument("--style", default="", help="ハイライト色の置き換え（例: red=magenta,yellow=none）")
+    args = parser.parse_args()
+
+    write_document(args.source, args.output, EditLog.load(args.edit_log), parse_style(args.style))
+    print(f"{args.output} を作成しました。")
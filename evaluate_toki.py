@@ -0,0 +1,258 @@
+"""
+このファイルではラベル付きの文を用いて、「時」「とき」の判定方法ごとの精度と速度を比較します。
+判定方法（ルールベース、分類器、カスケード、LLMのプロンプト・バッチサイズ・精度の組み合わせ）ごとに別プロセスで実行し、
+判定結果（0/1/2）ごとの適合率・再現率、1文あたりの処理時間（p50/p95）、スループット、最大使用メモリを並べて表示する。
+
+評価データはJSONL形式で、1行に1件 {"text": 文, "label": "0" | "1" | "2"} を記述する（toki_dataset.jsonl と同じ形式）。
+ラベルはLLMと同じく、0: 変換なし、1: とき→時、2: 時→とき とする。
+
+使い方:
+    python evaluate_toki.py                                   # eval/toki_labeled.jsonl ですべての判定方法を評価
+    python evaluate_toki.py --configs rule,classifier         # 判定方法を指定
+    python evaluate_toki.py --fixture data.jsonl --output result.json
+"""
+
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+# 既定の評価データ
+FIXTURE_PATH = "eval/toki_labeled.jsonl"
+
+# 評価する判定方法の設定
+# backend: "rule"（process.pyの構文解析）, "classifier", "cascade", "llm"
+CONFIGS = {
+    "rule": {"backend": "rule"},
+    "classifier": {"backend": "classifier"},
+    "cascade": {"backend": "cascade", "confidence_threshold": 0.8},
+    "llm-cot": {"backend": "llm", "prompt": "cot", "batch_size": 1, "torch_dtype": "bfloat16"},
+    "llm-short": {"backend": "llm", "prompt": "short", "batch_size": 1, "torch_dtype": "bfloat16"},
+    "llm-short-batch8": {"backend": "llm", "prompt": "short", "batch_size": 8, "torch_dtype": "bfloat16"},
+    "llm-cot-fp16": {"backend": "llm", "prompt": "cot", "batch_size": 1, "torch_dtype": "float16"},
+}
+
+# プロンプトの種類ごとの最大生成トークン数
+MAX_NEW_TOKENS = {"cot": 512, "short": 4}
+
+# 判定結果の種類
+LABELS = ["0", "1", "2"]
+
+
+def load_fixture(path):
+    """
+    評価データを読み込み、(文, ラベル) のリストを返す
+    """
+    samples = []
+    with open(path, encoding='utf-8') as fixture_file:
+        for line in fixture_file:
+            if line.strip():
+                sample = json.loads(line)
+                samples.append((sample["text"], str(sample["label"])))
+    return samples
+
+
+def predict_rule(texts):
+    """
+    process.py の構文解析（dep_ == "obl"）による判定。「時→とき」の変換があれば2、なければ0とする
+    """
+    import process
+
+    predictions = []
+    for text in texts:
+        start = time.perf_counter()
+        doc = process.nlp(text)
+        _, edits = process.analyze_toki(doc, None, io.StringIO(), text, text)
+        predictions.append(("2" if edits else "0", time.perf_counter() - start))
+    return predictions
+
+
+def predict_gated(texts, judge):
+    """
+    process_llm.py と同じく形態素解析で対象外の文は0とし、対象の文のみjudgeで判定する
+    """
+    import process_llm
+
+    predictions = []
+    for text in texts:
+        start = time.perf_counter()
+        is_target, _ = process_llm.gate_toki(text)
+        answer = judge(text) if is_target else "0"
+        predictions.append((answer, time.perf_counter() - start))
+    return predictions
+
+
+def predict_llm(texts, prompt, batch_size, torch_dtype):
+    """
+    LLMによる判定。形態素解析で対象外の文を除き、batch_size件ずつまとめて生成する
+    バッチ内の各文の処理時間はバッチ全体の処理時間とする
+    """
+    import process_llm
+
+    predictions = [None] * len(texts)
+    targets = []
+    for i, text in enumerate(texts):
+        start = time.perf_counter()
+        is_target, _ = process_llm.gate_toki(text)
+        if is_target:
+            targets.append(i)
+        else:
+            predictions[i] = ("0", time.perf_counter() - start)
+
+    pipe = process_llm.get_llm(torch_dtype).pipeline
+    if batch_size > 1 and pipe.tokenizer.pad_token is None:
+        # バッチ生成のため、文末トークンで左側をパディングする
+        pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+        pipe.tokenizer.padding_side = "left"
+
+    for batch_start in range(0, len(targets), batch_size):
+        batch = targets[batch_start:batch_start + batch_size]
+        prompts = [process_llm.build_toki_prompt(texts[i], prompt) for i in batch]
+
+        start = time.perf_counter()
+        outputs = pipe(prompts, batch_size=batch_size, do_sample=False, max_new_tokens=MAX_NEW_TOKENS[prompt], return_full_text=False)
+        elapsed = time.perf_counter() - start
+
+        for i, output in zip(batch, outputs):
+            generated_text = output[0]["generated_text"]
+            if prompt == "short":
+                # "short"のプロンプトは「回答:」で終わるため、生成部分の先頭に補って回答を取り出す
+                generated_text = "回答:" + generated_text
+            predictions[i] = (process_llm.parse_toki_answer(generated_text), elapsed)
+    return predictions
+
+
+def predict(config, texts):
+    """
+    設定に応じた判定方法で、(判定結果, 処理時間) のリストを返す
+    """
+    backend = config["backend"]
+    if backend == "rule":
+        return predict_rule(texts)
+    if backend == "classifier":
+        import toki_classifier
+        return predict_gated(texts, lambda text: toki_classifier.predict_toki(text)[0])
+    if backend == "cascade":
+        import process_llm
+        return predict_gated(texts, lambda text: process_llm.judge_toki_cascade(text, io.StringIO(), config["confidence_threshold"]))
+    return predict_llm(texts, config["prompt"], config["batch_size"], config["torch_dtype"])
+
+
+def percentile(values, ratio):
+    """
+    valuesのratio分位点（最近傍法）を返す
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def peak_memory_mb():
+    """
+    プロセスの最大使用メモリ（MB）を返す。GPUを使用した場合はGPUの最大確保量も返す
+    """
+    cpu = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    gpu = None
+    if "torch" in sys.modules:
+        import torch
+        if torch.cuda.is_available():
+            gpu = torch.cuda.max_memory_allocated() / 1024 / 1024
+    return cpu, gpu
+
+
+def evaluate(name, fixture_path):
+    """
+    1つの判定方法を評価し、結果を辞書で返す
+    """
+    samples = load_fixture(fixture_path)
+    texts = [text for text, _ in samples]
+    labels = [label for _, label in samples]
+
+    start = time.perf_counter()
+    predictions = predict(CONFIGS[name], texts)
+    elapsed = time.perf_counter() - start
+
+    answers = [answer for answer, _ in predictions]
+    latencies = [latency for _, latency in predictions]
+
+    per_label = {}
+    for label in LABELS:
+        true_positive = sum(1 for answer, expected in zip(answers, labels) if answer == label and expected == label)
+        predicted = answers.count(label)
+        actual = labels.count(label)
+        per_label[label] = {
+            "precision": true_positive / predicted if predicted else None,
+            "recall": true_positive / actual if actual else None,
+        }
+
+    cpu_memory, gpu_memory = peak_memory_mb()
+    return {
+        "config": name,
+        "samples": len(samples),
+        "accuracy": sum(1 for answer, label in zip(answers, labels) if answer == label) / len(samples),
+        "per_label": per_label,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        "throughput": len(samples) / elapsed,
+        "peak_memory_mb": cpu_memory,
+        "peak_gpu_memory_mb": gpu_memory,
+    }
+
+
+def format_ratio(value):
+    return "  -  " if value is None else f"{value:.2f}"
+
+
+def print_table(results):
+    """
+    評価結果を判定方法ごとに1行で表示する
+    """
+    header = f"{'判定方法':<18}{'正解率':>7}"
+    for label in LABELS:
+        header += f"  P{label}   R{label} "
+    header += f"{'p50(ms)':>10}{'p95(ms)':>10}{'文/秒':>9}{'メモリ(MB)':>12}"
+    print(header)
+    for result in results:
+        if "error" in result:
+            print(f"{result['config']:<18}エラー: {result['error']}")
+            continue
+        row = f"{result['config']:<18}{result['accuracy']:>7.2f}"
+        for label in LABELS:
+            scores = result["per_label"][label]
+            row += f" {format_ratio(scores['precision'])} {format_ratio(scores['recall'])}"
+        memory = result["peak_memory_mb"] if result["peak_gpu_memory_mb"] is None else result["peak_gpu_memory_mb"]
+        row += f"{result['latency_p50_ms']:>10.1f}{result['latency_p95_ms']:>10.1f}{result['throughput']:>9.1f}{memory:>12.0f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="「時」「とき」の判定方法ごとの精度と速度を比較します。")
+    parser.add_argument("--fixture", default=FIXTURE_PATH, help="評価データ（JSONL）")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help=f"評価する判定方法（カンマ区切り）: {', '.join(CONFIGS)}")
+    parser.add_argument("--config", help=argparse.SUPPRESS)  # 1つの判定方法を評価する子プロセス用
+    parser.add_argument("--output", help="評価結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    if args.config:
+        print(json.dumps(evaluate(args.config, args.fixture), ensure_ascii=False))
+        sys.exit(0)
+
+    # 最大使用メモリを判定方法ごとに計測するため、判定方法ごとに別プロセスで評価する
+    results = []
+    for name in args.configs.split(","):
+        completed = subprocess.run(
+            [sys.executable, __file__, "--config", name, "--fixture", args.fixture],
+            capture_output=True, text=True,
+        )
+        if completed.returncode == 0:
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        else:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"終了コード {completed.returncode}"
+            results.append({"config": name, "error": error})
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, ensure_ascii=False, indent=2)
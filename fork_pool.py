@@ -0,0 +1,81 @@
+"""
+このファイルでは、親プロセスで読み込んだMeCab・spaCyを
+fork によってワーカープロセスに引き継ぐプロセスプールを作成します。
+ワーカーごとにモデルを読み込み直さないため、起動時間とメモリ使用量がワーカー数に比例して増えない。
+
+fork した直後の子プロセスは親プロセスのメモリを共有しており（コピーオンライト）、
+書き込みが発生したページだけが子プロセスごとに複製される。
+Pythonのガベージコレクションは走査したオブジェクトのヘッダーを書き換えるため、
+fork の前に gc.freeze() で読み込み済みのオブジェクトを走査の対象から外し、共有ページが複製されないようにする。
+また、fork の前に malloc_trim で解放済みのヒープ領域をOSに返す。返さなかった領域は子プロセスの新しい確保に再利用され、
+確保のたびに親プロセスと共有しているページが複製されるため。
+
+生成AIモデルは共有しない。process_llm.py はワーカープロセスを使用せず、GPUで推論する場合はCUDAを初期化したプロセスを fork できないため。
+"""
+
+import ctypes
+import ctypes.util
+import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# ワーカープロセスのガベージコレクションの閾値（世代0）。
+# 解析中に生成される一時オブジェクトで頻繁に回収が走らないよう、既定値（700）より大きくする
+WORKER_GC_THRESHOLD = 10000
+
+
+def preload():
+    """
+    fork の前に親プロセスでモデルを読み込む関数
+    process.py を読み込むことでMeCabとspaCyを初期化する
+    """
+    import process  # MeCabとspaCyを初期化
+
+    return process
+
+
+def trim_heap():
+    """
+    解放済みのヒープ領域をOSに返す関数（glibcのmalloc_trim）
+    glibc以外のCライブラリでは何もしない
+    """
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return
+    libc = ctypes.CDLL(libc_name)
+    if hasattr(libc, "malloc_trim"):
+        libc.malloc_trim(0)
+
+
+def init_forked_worker():
+    """
+    fork したワーカープロセスの初期化
+    引き継いだオブジェクトは gc.freeze() 済みのため、ここでは新しく作るオブジェクトの回収頻度のみ調整する
+    """
+    _, threshold1, threshold2 = gc.get_threshold()
+    gc.set_threshold(WORKER_GC_THRESHOLD, threshold1, threshold2)
+
+
+def create_fork_pool(workers):
+    """
+    読み込み済みのモデルを引き継ぐワーカープロセスのプールを作成する関数
+    fork の直前にガベージコレクションを実行し、残ったオブジェクトを gc.freeze() で走査の対象から外す
+    回収で解放されたヒープ領域はOSに返してから fork する
+    プールを使い終えたら release_fork_pool を呼び出す
+    """
+    gc.collect()
+    gc.freeze()
+    trim_heap()
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=init_forked_worker,
+    )
+
+
+def release_fork_pool(executor):
+    """
+    プールを終了し、親プロセスで gc.freeze() したオブジェクトを再び回収の対象に戻す関数
+    """
+    executor.shutdown()
+    gc.unfreeze()
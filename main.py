@@ -1,24 +1,31 @@
-# docx_processing.py から関数をインポート
-from make_xml_from_wordfile import get_docx_file, extract_docx_to_xml
-from process import process_xml
-from remake_wordfile_from_xml import create_docx
 import os
+import resources  # CPUコア数・メモリ量に応じたワーカー数とスレッド数の設定
 
 
-# .docx ファイルのパス取得
-docx_file = get_docx_file("data")  # ディレクトリを指定
+# 複数のプロセスで解析する際に、ワーカープロセスでこの処理が再実行されないようにする
+if __name__ == "__main__":
+    # spaCy（BLAS）を読み込む前に、同時に実行中の校閲処理の数に応じてワーカー数とスレッド数を決める
+    plan = resources.configure(workers=os.cpu_count())
 
-# XMLへ変換
-extract_docx_to_xml(docx_file, "xml/")
-extract_docx_to_xml(docx_file, "xml_new/")  # 別ディレクトリへの変換
+    # docx_processing.py から関数をインポート
+    from make_xml_from_wordfile import get_docx_file, extract_docx_to_xml
+    from process import process_xml
+    from remake_wordfile_from_xml import create_docx
 
-# document.xml の存在確認と待機
-document_xml_path = 'xml_new/word/document.xml'
+    # .docx ファイルのパス取得
+    docx_file = get_docx_file("data")  # ディレクトリを指定
 
-# 校閲処理を実行
-process_xml(document_xml_path, 'mecab_analysis_log.txt', 'spacy_analysis_log.txt')
+    # XMLへ変換
+    extract_docx_to_xml(docx_file, "xml/")
+    extract_docx_to_xml(docx_file, "xml_new/")  # 別ディレクトリへの変換
 
-# 校閲後のXMLファイルをWordファイルに再構成
-core_filename = os.path.splitext(os.path.basename(docx_file))[0]
-output_docx = f"【校閲ずみ】{core_filename}.docx"
-create_docx("xml_new", output_docx)
\ No newline at end of file
+    # document.xml の存在確認と待機
+    document_xml_path = 'xml_new/word/document.xml'
+
+    # 校閲処理を実行（段落を分割して複数のプロセスで解析。読み込み済みのMeCab・spaCyをforkで共有）
+    process_xml(document_xml_path, 'mecab_analysis_log.txt', 'spacy_analysis_log.txt', workers=plan.workers, start_method="fork", edit_log_filename='edit_log.json')
+
+    # 校閲後のXMLファイルをWordファイルに再構成
+    core_filename = os.path.splitext(os.path.basename(docx_file))[0]
+    output_docx = f"【校閲ずみ】{core_filename}.docx"
+    create_docx("xml_new", output_docx)
\ No newline at end of file
@@ -1,3 +1,8 @@
+import resources  # CPUコア数・メモリ量に応じたスレッド数の設定
+
+# torch・spaCy（BLAS）を読み込む前に、同時に実行中の校閲処理の数に応じてスレッド数を決める
+resources.configure()
+
 # docx_processing.py から関数をインポート
 from make_xml_from_wordfile_llm import get_docx_file, extract_docx_to_xml
 from process_llm import process_xml
@@ -16,7 +21,7 @@ extract_docx_to_xml(docx_file, "xml_new/")  # 別ディレクトリへの変換
 document_xml_path = 'xml_new/word/document.xml'
 
 # 校閲処理を実行
-process_xml(document_xml_path, 'mecab_analysis_log.txt', 'spacy_analysis_log.txt')
+process_xml(document_xml_path, 'mecab_analysis_log.txt', 'spacy_analysis_log.txt', edit_log_filename='edit_log.json', dataset_filename='toki_dataset.jsonl')
 
 # 校閲後のXMLファイルをWordファイルに再構成
 core_filename = os.path.splitext(os.path.basename(docx_file))[0]
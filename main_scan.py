@@ -0,0 +1,53 @@
+"""
+文書を書き換えずに、用語誤りの箇所の一覧（JSONまたはCSV）のみを出力します。
+
+使い方:
+    python main_scan.py                                  # dataディレクトリ内のすべての.docxを検査
+    python main_scan.py a.docx b.docx -o report.csv      # ファイルを指定し、CSVで出力
+    python main_scan.py data --workers 4 --fail-on-findings
+"""
+
+import argparse
+import os
+import sys
+import resources  # CPUコア数・メモリ量に応じたワーカー数とスレッド数の設定
+
+
+# 複数のプロセスで検査する際に、ワーカープロセスでこの処理が再実行されないようにする
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="文書を書き換えずに用語誤り（他・外・時・とき）の箇所を一覧にします。")
+    parser.add_argument("paths", nargs="*", default=["data"], help="検査する.docxファイル、document.xml、またはディレクトリ")
+    parser.add_argument("-o", "--output", default="scan_report.json", help="出力ファイル（拡張子が.csvの場合はCSV、「-」の場合は標準出力）")
+    parser.add_argument("--format", choices=["json", "csv"], help="出力形式（省略時は出力ファイルの拡張子から判断）")
+    parser.add_argument("--toki-backend", default="rule", choices=["rule", "llm", "cascade", "classifier"], help="「時」「とき」の判定方法")
+    parser.add_argument("--workers", type=int, help="並列に検査するプロセス数（省略時は使用できるコア数に応じて決める。llm、cascadeでは常に1）")
+    parser.add_argument("--fail-on-findings", action="store_true", help="用語誤りが見つかった場合に終了コード1で終了する")
+    args = parser.parse_args()
+
+    # spaCy（BLAS）を読み込む前に、同時に実行中の校閲処理の数に応じてワーカー数とスレッド数を決める
+    # LLMを使用する判定方法では、ワーカーごとに生成AIモデルを読み込まないよう1プロセスで検査する
+    if args.toki_backend in ["llm", "cascade"]:
+        workers = 1
+    else:
+        workers = args.workers or os.cpu_count()
+    plan = resources.configure(workers=workers)
+
+    from scan import collect_paths, scan_files, write_report
+
+    files = collect_paths(args.paths)
+    if not files:
+        print("検査対象のファイルが見つかりませんでした")
+        sys.exit(0)
+
+    findings = scan_files(files, args.toki_backend, plan.workers)
+
+    report_format = args.format or ("csv" if args.output.endswith(".csv") else "json")
+    if args.output == "-":
+        write_report(findings, sys.stdout, report_format)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as output_file:
+            write_report(findings, output_file, report_format)
+        print(f"{len(files)}件のファイルから{len(findings)}件の用語誤りを検出しました（{args.output}）")
+
+    if args.fail_on_findings and findings:
+        sys.exit(1)
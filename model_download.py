@@ -1,19 +1,157 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+"""
+このファイルでは生成AIモデルのダウンロードと、ローカルに保存したモデルの読み込みを行います。
+ダウンロードは python model_download.py の実行時のみ行い、モデルの読み込み時にはネットワークに接続しない。
+"""
 
-# モデルとトークナイザをダウンロードしてローカルのmodelディレクトリに保存
+import glob
+import json
+import os
+import resource
+import time
+
+import resources  # メモリが空いている場合のみモデルを読み込む
+
+# ダウンロードするモデル
 model_name = "elyza/Llama-3-ELYZA-JP-8B"
 # モデル格納先ディレクトリを指定
 model_dir = "model"
+# ダウンロードしたモデル一式（スナップショット）の格納先
+snapshot_dir = os.path.join(model_dir, "elyza_llama3")
+# 支援付き生成（assisted generation）で用いる小型のドラフトモデルの格納先
+# トークナイザーが上記のモデルと共通のモデルを配置する
+draft_model_dir = os.path.join(model_dir, "draft")
+
+# モデルの重みを読み込む精度（"bfloat16"、"float16"、"float32" のいずれか）
+TORCH_DTYPE = "bfloat16"
+
+# 精度ごとの1パラメータあたりのバイト数
+DTYPE_BYTES = {"float32": 4, "bfloat16": 2, "float16": 2}
+
+# モデルの読み込みに必要なメモリ量を重みのサイズから見積もる際の余裕（重みのサイズに対する倍率）
+MODEL_MEMORY_MARGIN = 1.2
+
+# 他の校閲処理がメモリを使用している場合に、空くのを待つ最大の時間（秒）
+MODEL_ADMISSION_TIMEOUT = 60 * 60
+
+# 読み込み済みのトークナイザーとモデル（初回の呼び出し時に読み込む）
+tokenizer = None
+models = {}
+draft_models = {}
+
+
+def download_model(repo_id=model_name, local_dir=snapshot_dir):
+    """
+    モデルとトークナイザーをHugging Face Hubからダウンロードし、local_dirに保存する関数
+    重みはsafetensors形式のみを保存する
+    """
+    from huggingface_hub import snapshot_download
+
+    snapshot_download(
+        repo_id=repo_id,
+        local_dir=local_dir,
+        allow_patterns=["*.json", "*.safetensors", "tokenizer*"],
+    )
+    print(f"{repo_id} を {local_dir} に保存しました。")
+
+
+def resolve_snapshot(path=snapshot_dir):
+    """
+    ローカルに保存したモデルのディレクトリを返す関数
+    snapshot_dir の場合は、以前の cache_dir="model" 形式で保存したスナップショットも探す
+    見つからない場合はネットワークに接続せずにエラーとする
+    """
+    candidates = [path]
+    if path == snapshot_dir:
+        cache_name = "models--" + model_name.replace("/", "--")
+        candidates += sorted(glob.glob(os.path.join(model_dir, cache_name, "snapshots", "*")), key=os.path.getmtime, reverse=True)
+
+    for candidate in candidates:
+        has_config = os.path.exists(os.path.join(candidate, "config.json"))
+        has_weights = bool(glob.glob(os.path.join(candidate, "*.safetensors")))
+        if has_config and has_weights:
+            return candidate
+
+    raise FileNotFoundError(
+        f"{path} にモデル（config.json と *.safetensors）が見つかりません。"
+        f"ネットワークに接続できる環境で python model_download.py を実行し、{model_dir} ディレクトリを配置してください。"
+    )
+
 
-# トークナイザーとモデルを指定ディレクトリにキャッシュ
-tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=model_dir)
-model = AutoModelForCausalLM.from_pretrained(model_name, cache_dir=model_dir)
+def peak_memory_gb():
+    """
+    プロセスの最大使用メモリ（GB）を返す関数
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
 
 
 def get_tokenizer():
     # トークナイザーを別ファイルで使用するための関数
+    global tokenizer
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(resolve_snapshot(), local_files_only=True)
     return tokenizer
 
-def get_model():
-    # トークナイザーを別ファイルで使用するための関数
-    return model
\ No newline at end of file
+
+def model_memory_gb(path, torch_dtype):
+    """
+    モデルをtorch_dtypeの精度で読み込むのに必要なメモリ量（GB）を、safetensorsの重みのサイズから見積もる関数
+    保存時の精度はconfig.jsonのtorch_dtypeから取得する
+    """
+    snapshot = resolve_snapshot(path)
+    weights_size = sum(os.path.getsize(weights) for weights in glob.glob(os.path.join(snapshot, "*.safetensors")))
+    with open(os.path.join(snapshot, "config.json"), encoding='utf-8') as config_file:
+        stored_dtype = json.load(config_file).get("torch_dtype", torch_dtype)
+    ratio = DTYPE_BYTES.get(torch_dtype, 2) / DTYPE_BYTES.get(stored_dtype, 2)
+    return weights_size * ratio * MODEL_MEMORY_MARGIN / 1024 ** 3
+
+
+def load_local_model(path, torch_dtype):
+    """
+    ローカルのスナップショットからモデルを読み込む関数
+    safetensorsの重みをメモリマップで読み込み、指定した精度のまま配置する（float32への変換を行わない）
+    同じホストの他の校閲処理と合わせてメモリが不足する場合は、空くまで読み込みを待つ
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    required_gb = model_memory_gb(path, torch_dtype)
+    with resources.admit(required_gb, timeout=MODEL_ADMISSION_TIMEOUT, use_gpu=torch.cuda.is_available()):
+        start = time.perf_counter()
+        model = AutoModelForCausalLM.from_pretrained(
+            resolve_snapshot(path),
+            local_files_only=True,
+            use_safetensors=True,
+            torch_dtype=getattr(torch, torch_dtype),
+            low_cpu_mem_usage=True,
+        )
+    elapsed = time.perf_counter() - start
+    print(f"{path} の読み込み時間: {elapsed:.1f}秒, 最大使用メモリ: {peak_memory_gb():.1f}GB（{torch_dtype}）")
+    return model
+
+
+def get_model(torch_dtype=TORCH_DTYPE):
+    # モデルを別ファイルで使用するための関数
+    if torch_dtype not in models:
+        models[torch_dtype] = load_local_model(snapshot_dir, torch_dtype)
+    return models[torch_dtype]
+
+
+def get_draft_model(torch_dtype=TORCH_DTYPE):
+    # 支援付き生成で用いるドラフトモデルを別ファイルで使用するための関数
+    if torch_dtype not in draft_models:
+        draft_models[torch_dtype] = load_local_model(draft_model_dir, torch_dtype)
+    return draft_models[torch_dtype]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成AIモデルをダウンロードします。")
+    parser.add_argument("--draft", metavar="REPO_ID", help="支援付き生成で用いるドラフトモデル（トークナイザーが共通の小型モデル）を追加でダウンロード")
+    args = parser.parse_args()
+
+    download_model()
+    if args.draft:
+        download_model(args.draft, draft_model_dir)
@@ -5,7 +5,13 @@
 from lxml import etree as ET  # lxmlを使用
 import MeCab  # MeCabを使用した形態素解析
 import spacy  # spaCyを使用した構文解析
-import copy
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import fork_pool  # 読み込み済みのモデルを共有するプロセスプール
+from sentence_split import split_sentences  # 文単位の処理単位に分割
+from mecab_tokens import tokenize  # 文字位置つきのトークン列による形態素解析
+from edit_log import EditLog, iter_paragraph_runs, map_edits, write_document  # 変換箇所の記録と書き出し
 
 # MeCabのトークナイザーを初期化
 mecab = MeCab.Tagger("-Ochasen")
@@ -17,119 +23,91 @@ nlp = spacy.load("ja_core_news_md")
 namespaces = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
 ET.register_namespace('w', namespaces['w'])  # 処理の前後でxmlタグの名称が変更されないように指定
 
-def create_highlight(original_rpr, text, color):
+# 複数のプロセスで解析する際に、1回にまとめて渡す<w:r>の数
+CHUNK_SIZE = 64
+
+def is_hoka(token):
     """
-    新しい <w:r> 要素を作成し、指定された色でハイライトを適用した <w:t> を含む。
-    元の <w:rPr> 要素をそのままコピーして適用し、ハイライトを追加する。
+    形態素解析のトークンが「ほか」に変換する「他」「外」かどうかを判定する関数
+    名詞の「他」「外」のうち、「ソト」または「ガイ」と読まれないものを対象とする
     """
-    new_run = ET.Element('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r')
-
-    if original_rpr is not None:
-        # 元の <w:rPr> 要素を深くコピー
-        new_rpr = copy.deepcopy(original_rpr)
-        new_run.append(new_rpr)
-
-        # ハイライトの要素を追加
-        highlight_elem = ET.SubElement(new_rpr, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}highlight')
-        highlight_elem.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val', color)
-    else:
-        # 元の <w:rPr> がない場合でもハイライトを追加
-        new_rpr = ET.SubElement(new_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr')
-        highlight_elem = ET.SubElement(new_rpr, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}highlight')
-        highlight_elem.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val', color)
-
-    # 新しい <w:t> 要素を追加
-    new_text_element = ET.SubElement(new_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-    new_text_element.text = text
+    return token.surface in ["他", "外"] and token.pos.startswith("名詞") and token.pronunciation not in ["ソト", "ガイ"]
 
-    return new_run
+def is_toki_conversion(surface, pronunciation, dep):
+    """
+    構文解析のトークンが「とき」に変換する「時」かどうかを判定する関数
+    読みが「トキ」の「時」で、副詞句（dep: obl）であるものを対象とする
+    """
+    return surface == "時" and pronunciation == "トキ" and dep == "obl"
 
-def create_plain_run(original_rpr, text):
+def build_pronunciation_map(text):
     """
-    元の<w:rPr>を保持しつつ、<w:r>要素を複製
+    形態素解析を行い、テキスト上の文字位置から読み仮名を引くための辞書を作成する関数
+    spaCyのトークンの読み仮名は token.idx で引く（同じ表層形でも「15時」「時は」のように読みが異なるため）
     """
-    plain_run = ET.Element('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r')
-    if original_rpr is not None:
-        plain_rpr = copy.deepcopy(original_rpr)
-        plain_run.append(plain_rpr)
-    plain_text_element = ET.SubElement(plain_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-    plain_text_element.text = text
-    return plain_run
+    return {mecab_token.start: mecab_token.pronunciation for mecab_token in tokenize(mecab, text)}
 
 def analyze_hoka(text, log_file):
     """
     形態素解析で表層形が「他」、「外」となるものを検知し、「ほか」に変換する関数
     解析結果を指定されたテキストファイルに書き出す
+    (変換後のテキスト, 変換箇所, 変換後のテキストの各文字に対応するtext上の位置) を返す
+    変換箇所は text 上の (開始位置, 終了位置, 置き換える文字列, ハイライト色) のリスト
     """
-    tokens = mecab.parse(text).splitlines()
+    tokens = tokenize(mecab, text)
     new_text = ""
-    highlighted_runs = []
+    edits = []
+    positions = []
     
     # 解析前のテキストをログファイルに書き出し
     log_file.write(f"解析前のテキスト: {text}\n")
     
     for token in tokens:
-        if token == 'EOS':  # EOS(End of Sentence)は無視
-            continue
-
-        parts = token.split('\t')
-        if len(parts) < 4:
-            continue
-        
-        surface = parts[0]  # 表層形
-        pronunciation = parts[1]  # 読み仮名
-        pos = parts[3]  # 品詞情報
+        surface = token.surface  # 表層形
+        pronunciation = token.pronunciation  # 読み仮名
+        pos = token.pos  # 品詞情報
 
         # 解析結果をログファイルに書き出し
         log_file.write(f"表層形: {surface}, 読み仮名: {pronunciation}, 品詞: {pos}\n")
 
         # 「ほか」を意味するものを検知（例: 名詞「他」「外」など）
         # 「ソト」または「ガイ」と読まれない場合にのみ「ほか」として検知する条件を追加
-        if (surface in ["他", "外"] and pos.startswith("名詞") and pronunciation not in ["ソト", "ガイ"]):
-            highlighted_runs.append((surface, "ほか", "yellow"))
+        if is_hoka(token):
+            edits.append((token.start, token.end, "ほか", "yellow"))
             new_text += "ほか"
+            positions.extend([token.start, token.start])  # 1文字が2文字に置き換わる
         else:
             new_text += surface
+            positions.extend(range(token.start, token.end))
 
     # 変換後のテキストをログファイルに書き出し
     log_file.write(f"変換後のテキスト: {new_text}\n\n")
     
-    return new_text, highlighted_runs
+    return new_text, edits, positions
 
 def analyze_toki(doc, original_rpr, syntax_log_file, combined_text, combined_pronunciation):
     """
     構文解析で「時」と「とき」の検知を行う関数
     形態素解析で表層形が「時」「とき」で、かつ読みが「ジ」、「ガイ」でないものを対象とする
     構文解析結果を指定されたテキストファイルに書き出す
+    combined_pronunciationには構文解析したテキスト（doc.text）を渡し、読み仮名はその上の文字位置で引く
+    変換箇所は構文解析したテキスト（doc.text）上の (開始位置, 終了位置, 置き換える文字列, ハイライト色) のリストで返す
     """
     modified_text = []
-    highlighted_runs = []
+    edits = []
     
     # 結合された文章に対して形態素解析を行い、読み仮名を取得
-    mecab_result = mecab.parse(combined_text).splitlines()
-    pronunciation_map = {}
-    for mecab_token in mecab_result:
-        if mecab_token == 'EOS':
-            continue
-
-        parts = mecab_token.split('\t')
-        if len(parts) < 4:
-            continue
-
-        surface = parts[0]  # 表層形
-        pronunciation = parts[1]  # 読み仮名
-
-        pronunciation_map[surface] = pronunciation
+    pronunciation_map = build_pronunciation_map(combined_pronunciation)  # 文字位置 -> 読み仮名
 
     # spaCyを用いた構文解析
     for token in doc:
         surface = token.text
-        pronunciation = pronunciation_map.get(surface, "")
+        pronunciation = pronunciation_map.get(token.idx, "")
 
         if surface in ["時", "とき"] and pronunciation == "トキ":
             # 構文解析を行い、副詞句である場合に変換を適用
-            if token.dep_ == "obl" and surface == "時":
-                highlighted_runs.append((surface, "とき", "red"))
+            if is_toki_conversion(surface, pronunciation, token.dep_):
+                edits.append((token.idx, token.idx + len(surface), "とき", "red"))
                 modified_text.append("とき")
                 syntax_log_file.write(f"解析: {surface}, 読み仮名: {pronunciation}, dep: {token.dep_}\n")
                 syntax_log_file.write(f"変換: {surface} -> とき\n")
@@ -141,85 +119,106 @@ def analyze_toki(doc, original_rpr, syntax_log_file, combined_text, combined_pro
             syntax_log_file.write(f"--: {surface}, 読み仮名: {pronunciation}, dep: {token.dep_}\n")
             modified_text.append(surface)
     
-    return "".join(modified_text), highlighted_runs
+    return "".join(modified_text), edits
 
-def split_and_highlight_text_element(text_element, log_file, syntax_log_file):
+def analyze_sentences(combined_text, original_rpr, log_file, syntax_log_file):
     """
-    該当する<w:t>要素を切り分け、キーワードを含む部分にハイライトを追加する関数
+    テキストを文単位に分割し、文ごとに形態素解析と構文解析を行う関数
+    1回の解析で扱う文字数を制限し、変換後のテキストと変換箇所（combined_text上の位置）を文の順に結合して返す
     """
-    parent_run = text_element.getparent()
-    original_rpr = parent_run.find('.//w:rPr', namespaces)  # 元の<w:rPr>情報を取得
-    
-    # <w:t>要素を結合して1つのテキストにする
-    combined_text = "".join([t.text for t in parent_run.findall('.//w:t', namespaces) if t.text])
-    
-    # テキスト全体を形態素解析で変換
-    modified_text, highlighted_runs_mecab = analyze_hoka(combined_text, log_file)
+    units = split_sentences(combined_text)
 
-    # 変換されたテキストでspaCyによる構文解析を実行
-    doc = nlp(modified_text)
-    syntactically_modified_text, highlighted_runs_spacy = analyze_toki(doc, original_rpr, syntax_log_file, combined_text, modified_text)
+    # 文ごとに形態素解析で変換
+    hoka_results = [analyze_hoka(unit.text, log_file) for unit in units]
 
-    # ハイライトとテキストの置き換え処理
-    new_elements = []
-    highlighted_runs = highlighted_runs_mecab + highlighted_runs_spacy
-    current_position = 0
-    
-    # 元のテキストのどの位置まで処理されたかを記録
-    for original_text, modified_text, color in highlighted_runs:
-        index = syntactically_modified_text.find(modified_text, current_position)
-        if index == -1:
-            continue
-
-        # ハイライトされない部分を追加
-        if current_position < index:
-            unhighlighted_text = syntactically_modified_text[current_position:index]
-            if unhighlighted_text:
-                new_elements.append(create_plain_run(original_rpr, unhighlighted_text))
-
-        # ハイライトされた部分を追加
-        new_elements.append(create_highlight(original_rpr, modified_text, color))
-        current_position = index + len(modified_text)
-
-    # 残りの部分を追加
-    if current_position < len(syntactically_modified_text):
-        remaining_text = syntactically_modified_text[current_position:]
-        new_elements.append(create_plain_run(original_rpr, remaining_text))
-
-    # 元の要素を削除して新しい要素を追加
-    parent = parent_run.getparent()
-    for new_element in new_elements:
-        parent.insert(parent.index(parent_run), new_element)
-    parent.remove(parent_run)
-
-def process_xml(xml_file, log_filename, syntax_log_filename):
+    # 変換されたテキストでspaCyによる構文解析をまとめて実行
+    docs = nlp.pipe([modified_text for modified_text, _, _ in hoka_results])
+
+    modified_parts = []
+    edits = []
+    for unit, (modified_text, edits_mecab, positions), doc in zip(units, hoka_results, docs):
+        syntactically_modified_text, edits_spacy = analyze_toki(doc, original_rpr, syntax_log_file, unit.text, modified_text)
+        modified_parts.append(syntactically_modified_text)
+        # 構文解析の変換箇所は「他」「外」を変換したテキスト上の位置のため、元のテキスト上の位置に直す
+        edits.extend(map_edits(edits_mecab, range(len(unit.text)), unit.start) + map_edits(edits_spacy, positions, unit.start))
+
+    return "".join(modified_parts), edits
+
+def iter_target_runs(source):
+    """
+    処理対象の文字列（「他」、「外」、「時」、「とき」）を含む段落から、<w:r>のテキストを文書の順に取り出す関数
+    document.xmlを先頭から順に読み込み、(段落番号, <w:r>番号, <w:r>内のテキスト) を返す
+    """
+    for paragraph_index, run_texts in iter_paragraph_runs(source):
+        # 処理対象の文字列を含むかチェック
+        full_text = "".join(run_texts)
+        if any(keyword in full_text for keyword in ["とき", "時", "他", "外"]):
+            for run_index, combined_text in enumerate(run_texts):
+                yield paragraph_index, run_index, combined_text
+
+def analyze_chunk(texts):
+    """
+    複数の<w:r>のテキストをまとめて解析する関数（ワーカープロセスで実行する）
+    ログはファイルに直接書かずに文字列として返し、呼び出し元で文書の順に書き出す
+    (変換箇所, 形態素解析ログ, 構文解析ログ) のリストを返す
+    """
+    results = []
+    for text in texts:
+        log_file = io.StringIO()
+        syntax_log_file = io.StringIO()
+        _, edits = analyze_sentences(text, None, log_file, syntax_log_file)
+        results.append((edits, log_file.getvalue(), syntax_log_file.getvalue()))
+    return results
+
+def process_xml(xml_file, log_filename, syntax_log_filename, workers=1, chunk_size=CHUNK_SIZE, start_method="spawn", edit_log_filename=None):
     """
     xmlからテキストを取得し、対象文字列（「他」、「外」、「時」、「とき」）を検索
     変換条件に一致する場合は変換を行い、ハイライトを付与
+    workersが2以上の場合は、処理対象の<w:r>をchunk_size件ずつに分けて複数のプロセスで解析する
+    start_methodが"spawn"の場合、各プロセスは起動時にprocess.pyを読み込み、MeCabとspaCyをプロセスごとに初期化する
+    "fork"の場合は、このプロセスで読み込み済みのMeCabとspaCyをコピーオンライトで共有する（fork_pool.py）
+    解析の段階ではxmlを書き換えずに変換箇所を編集ログ（edit_log.py）に記録し、xmlの書き出し時にまとめて反映する
+    編集ログは文書の順に記録するため、出力はworkers=1の場合と同じになる
+    edit_log_filenameを指定すると編集ログを保存する（python edit_log.py でハイライト色を変えて作り直せる）
     """
-    keyword_count = 0   # 処理対象となった要素をカウント
-    processed_elements = []  # 処理対象の要素を格納するリスト
+    edit_log = EditLog()
 
     # ログファイルを開く
     with open(log_filename, 'w', encoding='utf-8') as log_file, open(syntax_log_filename, 'w', encoding='utf-8') as syntax_log_file:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        for paragraph in root.findall('.//w:p', namespaces):
-            # <w:t>要素を取得
-            full_text = "".join(text_elem.text for text_elem in paragraph.findall('.//w:t', namespaces) if text_elem.text)
-
-            # 処理対象の文字列を含むかチェック
-            if any(keyword in full_text for keyword in ["とき", "時", "他", "外"]):
-                keyword_count += 1  # カウントを増加(デバッグ用)
-                processed_elements.append(full_text)  # 処理対象の要素をリストに追加
-
-                # キーワードを含む<w:t>要素を切り分け、ハイライトを追加
-                for text_elem in paragraph.findall('.//w:t', namespaces):
-                    if text_elem.text:
-                        split_and_highlight_text_element(text_elem, log_file, syntax_log_file)  # 変換後にハイライトを適用
-
-    tree.write(xml_file, encoding='utf-8', xml_declaration=True, pretty_print=True)
-
-
-# process_xml('xml_new/word/document.xml', 'mecab_analysis_log.txt', 'spacy_analysis_log.txt')
\ No newline at end of file
+        # 処理対象の<w:r>をchunk_size件ずつに分割
+        target_runs = list(iter_target_runs(xml_file))
+        chunks = [target_runs[i:i + chunk_size] for i in range(0, len(target_runs), chunk_size)]
+        text_chunks = [[combined_text for _, _, combined_text in chunk] for chunk in chunks]
+
+        workers = min(workers, len(chunks))
+        if workers > 1 and start_method == "fork":
+            executor = fork_pool.create_fork_pool(workers)
+            results = executor.map(analyze_chunk, text_chunks)
+        elif workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            results = executor.map(analyze_chunk, text_chunks)
+        else:
+            executor = None
+            results = map(analyze_chunk, text_chunks)
+
+        try:
+            # 解析結果を文書の順にログと編集ログへ書き出す
+            for chunk, chunk_results in zip(chunks, results):
+                for (paragraph_index, run_index, _), (edits, log_text, syntax_log_text) in zip(chunk, chunk_results):
+                    log_file.write(log_text)
+                    syntax_log_file.write(syntax_log_text)
+                    edit_log.add_run(paragraph_index, run_index, edits)
+        finally:
+            if executor is not None and start_method == "fork":
+                fork_pool.release_fork_pool(executor)
+            elif executor is not None:
+                executor.shutdown()
+
+    if edit_log_filename:
+        edit_log.save(edit_log_filename)
+
+    # 変換箇所を反映しながらxmlを書き出す
+    write_document(xml_file, xml_file, edit_log)
+
+
+# process_xml('xml_new/word/document.xml', 'mecab_analysis_log.txt', 'spacy_analysis_log.txt')
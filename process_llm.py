@@ -2,138 +2,168 @@
 このファイルでは校閲対象となる文字列を含むテキストを抽出し、LLMを使用して用語の校閲を行います。
 """
 
-from lxml import etree as ET  # lxmlを使用
-import MeCab  # MeCabを使用した形態素解析
-import spacy  # spaCyを使用した構文解析
-import copy
-from model_download import get_tokenizer, get_model
+import io
+import process  # ルールベースの校閲処理（LLMの制限時間を超えた文の判定に使用）
+from sentence_split import split_sentences  # 文単位の処理単位に分割
+from mecab_tokens import tokenize  # 文字位置つきのトークン列による形態素解析
+from edit_log import EditLog, map_edits, write_document  # 変換箇所の記録と書き出し
 from transformers import pipeline
 from langchain_huggingface.llms import HuggingFacePipeline
 import re
+import queue
+import threading
+import time
+from collections import Counter
+from toki_rules import judge_toki_rule  # ルールベースによる「時」「とき」の判定
+import toki_classifier  # LLMの判定結果から学習した軽量分類器
 
 
-# MeCabのトークナイザーを初期化
-mecab = MeCab.Tagger("-Ochasen")
+# MeCabのトークナイザーとspaCyの日本語モデルは、process.py で初期化したものを共用する
+mecab = process.mecab
+nlp = process.nlp
 
-# spaCyの日本語モデルをロード
-nlp = spacy.load("ja_core_news_md")
+# 支援付き生成（model/draft に配置した小型のドラフトモデルを併用）を行う場合はTrueにする
+# 思考過程を含む長い出力を生成する際の速度を改善する。貪欲法のため判定結果は変わらない
+USE_DRAFT_MODEL = False
 
-# 名前空間の定義
-namespaces = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-ET.register_namespace('w', namespaces['w'])  # 処理の前後でxmlタグの名称が変更されないように指定
+# LLMは判定に必要になった時点で読み込む（ルールベースや分類器のみで判定する場合はGPUを使用しない）
+# モデルの精度（"bfloat16"など）ごとに保持する
+llms = {}
 
-model_dir = "./model/elyza_llama3"
-# ローカルのモデルとトークナイザを読み込む
-# トークナイザとモデルを取得
-tokenizer = get_tokenizer()
-model = get_model()
-
-# パイプラインの作成
-pipe = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    # max_new_tokens=1,
-    device=0
-    # temperatureを0に
-)
-
-# HuggingFace Pipelineのラッパーを作成
-llm = HuggingFacePipeline(pipeline=pipe)
-
-def create_highlight(original_rpr, text, color):
+def get_llm(torch_dtype=None):
     """
-    新しい <w:r> 要素を作成し、指定された色でハイライトを適用した <w:t> を含む。
-    元の <w:rPr> 要素をそのままコピーして適用し、ハイライトを追加する。
+    ローカルのモデルとトークナイザを読み込み、HuggingFace Pipelineのラッパーを返す関数
+    torch_dtypeを省略した場合はmodel_download.pyのTORCH_DTYPEの精度で読み込む
+    モデルの読み込みは精度ごとに初回呼び出し時のみ行う
+    """
+    if torch_dtype not in llms:
+        from model_download import get_tokenizer, get_model, get_draft_model, TORCH_DTYPE
+
+        # ローカルのモデルとトークナイザを読み込む
+        # トークナイザとモデルを取得
+        tokenizer = get_tokenizer()
+        model = get_model(torch_dtype or TORCH_DTYPE)
+
+        # パイプラインの作成
+        pipe = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+            # max_new_tokens=1,
+            device=0
+            # temperatureを0に
+        )
+
+        # 貪欲法で生成する（ドラフトモデルの有無で生成結果が変わらないようにする）
+        pipeline_kwargs = {"do_sample": False}
+        if USE_DRAFT_MODEL:
+            # ドラフトモデルが提案したトークンを本体のモデルでまとめて検証する支援付き生成を行う
+            pipeline_kwargs["assistant_model"] = get_draft_model(torch_dtype or TORCH_DTYPE).to(pipe.device)
+
+        # HuggingFace Pipelineのラッパーを作成
+        llms[torch_dtype] = HuggingFacePipeline(pipeline=pipe, pipeline_kwargs=pipeline_kwargs)
+    return llms[torch_dtype]
+
+# LLMに渡すプロンプトの種類（"cot": 段階的に考察させる, "short": 数字のみを回答させる）
+PROMPT_VARIANT = "cot"
+
+# カスケード判定でルールベースの判定結果を採用する確信度の下限
+CONFIDENCE_THRESHOLD = 0.8
+
+# 「時」「とき」を含む文がどの段階で判定されたかを数える
+# （gate: 形態素解析で対象外, rule: ルールベース, classifier: 分類器, llm: LLM, fallback: 制限時間超過で構文解析）
+toki_tier_counts = Counter()
+
+# 文書1件あたりのLLMによる判定の制限時間（秒）。Noneの場合は制限しない
+# 制限時間を超えた後の文は、process.py の構文解析で判定する
+DOCUMENT_DEADLINE = None
+
+# LLMの1回の呼び出しの制限時間（秒）。Noneの場合は制限しない
+LLM_CALL_TIMEOUT = None
+
+# 制限時間を超えたため process.py の構文解析で判定した箇所のハイライト色
+# LLMで判定した箇所（赤）より確信度が低いことを示す
+FALLBACK_COLOR = "cyan"
+
+# パイプラインの段階間のキューに保持する<w:r>の上限数
+PIPELINE_QUEUE_SIZE = 8
+
+# パイプラインの終了を次の段階に伝えるための目印
+PIPELINE_END = object()
+
+class TokiBudget:
+    """
+    文書1件のLLMによる判定の制限時間を管理するクラス
+    deadline: 文書全体の制限時間（秒）, call_timeout: LLMの1回の呼び出しの制限時間（秒）
+    judgments: plan_toki_judgments で文書の処理前に判定した結果 {文: (判定結果, ログ, 代替判定の理由)}
+    rule_verdicts: plan_toki_judgments で判定順を決める際のルールベースの判定結果 {文: (判定結果, 確信度, 根拠)}
     """
-    new_run = ET.Element('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r')
 
-    if original_rpr is not None:
-        # 元の <w:rPr> 要素を深くコピー
-        new_rpr = copy.deepcopy(original_rpr)
-        new_run.append(new_rpr)
+    def __init__(self, deadline=None, call_timeout=None):
+        self.deadline = deadline
+        self.deadline_at = None
+        self.call_timeout = call_timeout
+        self.judgments = {}
+        self.rule_verdicts = {}
 
-        # ハイライトの要素を追加
-        highlight_elem = ET.SubElement(new_rpr, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}highlight')
-        highlight_elem.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val', color)
-    else:
-        # 元の <w:rPr> がない場合でもハイライトを追加
-        new_rpr = ET.SubElement(new_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr')
-        highlight_elem = ET.SubElement(new_rpr, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}highlight')
-        highlight_elem.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val', color)
+    def start(self):
+        """
+        文書全体の制限時間の計測を始める
+        形態素解析・構文解析による判定順の計画を終えてから呼び出し、その時間を制限時間に含めない
+        """
+        if self.deadline is not None:
+            self.deadline_at = time.monotonic() + self.deadline
 
-    # 新しい <w:t> 要素を追加
-    new_text_element = ET.SubElement(new_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-    new_text_element.text = text
+    def expired(self):
+        return self.deadline_at is not None and time.monotonic() >= self.deadline_at
 
-    return new_run
+    def next_timeout(self):
+        """
+        次のLLMの呼び出しの制限時間（1回の制限時間と文書の残り時間の短い方）を返す
+        """
+        timeouts = [] if self.call_timeout is None else [self.call_timeout]
+        if self.deadline_at is not None:
+            timeouts.append(max(0.0, self.deadline_at - time.monotonic()))
+        return min(timeouts) if timeouts else None
 
-def create_plain_run(original_rpr, text):
+def gate_toki(text):
     """
-    元の<w:rPr>を保持しつつ、<w:r>要素を複製
+    形態素解析の結果から、「時」と「とき」の使い分けを判定する必要がある文かどうかを判定する関数
+    読みが「トキ」の単独の「時」「とき」を含む場合のみ対象とし、(単独の「時」「とき」のトークンのリスト, 対象外の理由) を返す
+    対象外の場合、トークンのリストは空になる
+    「時間」「時点」「同時」「当時」などの複合語や、「15時」のように「ジ」と読む「時」は対象外とする
     """
-    plain_run = ET.Element('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r')
-    if original_rpr is not None:
-        plain_rpr = copy.deepcopy(original_rpr)
-        plain_run.append(plain_rpr)
-    plain_text_element = ET.SubElement(plain_run, '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-    plain_text_element.text = text
-    return plain_run
-
-def analyze_hoka(text, log_file):
+    toki_tokens = []
+    skipped = []
+    for token in tokenize(mecab, text):
+        if token.surface in ["時", "とき"] and token.pronunciation == "トキ":
+            toki_tokens.append(token)
+        elif "時" in token.surface or "とき" in token.surface:
+            skipped.append(f"{token.surface}（{token.pronunciation}）")
+
+    if toki_tokens:
+        return toki_tokens, None
+    return toki_tokens, "単独の「時」「とき」なし: " + ", ".join(skipped)
+
+def build_toki_prompt(text, variant=PROMPT_VARIANT):
     """
-    形態素解析で表層形が「他」、「外」となるものを検知し、「ほか」に変換する関数
-    解析結果を指定されたテキストファイルに書き出す
+    「時」と「とき」の使い分けを判断させるためのプロンプトを作成する関数
+    variantが"short"の場合は考察を省き、数字のみを回答させる短いプロンプトを作成する
     """
-    tokens = mecab.parse(text).splitlines()
-    new_text = ""
-    highlighted_runs = []
-    
-    # 解析前のテキストをログファイルに書き出し
-    log_file.write(f"解析前のテキスト: {text}\n")
-    
-    for token in tokens:
-        if token == 'EOS':  # EOS(End of Sentence)は無視
-            continue
-
-        parts = token.split('\t')
-        if len(parts) < 4:
-            continue
-        
-        surface = parts[0]  # 表層形
-        pronunciation = parts[1]  # 読み仮名
-        pos = parts[3]  # 品詞情報
-
-        # 解析結果をログファイルに書き出し
-        log_file.write(f"表層形: {surface}, 読み仮名: {pronunciation}, 品詞: {pos}\n")
-
-        # 「ほか」を意味するものを検知（例: 名詞「他」「外」など）
-        # 「ソト」または「ガイ」と読まれない場合にのみ「ほか」として検知する条件を追加
-        if (surface in ["他", "外"] and pos.startswith("名詞") and pronunciation not in ["ソト", "ガイ"]):
-            highlighted_runs.append((surface, "ほか", "yellow"))
-            new_text += "ほか"
-        else:
-            new_text += surface
+    if variant == "short":
+        return f"""
+        次のテキストに含まれる「時」と「とき」の使い分けを判断してください。
+        テキスト: {text}
 
-    # 変換後のテキストをログファイルに書き出し
-    log_file.write(f"変換後のテキスト: {new_text}\n\n")
-    
-    return new_text, highlighted_runs
+        単独で用いられる「時」や「とき」を「場合」と言い換えても自然な文章が成立するのであれば「とき」が正しい用法です。
+        「時点」と言い換えても意味が通るものは「時」が正しい用法になります。
+        「時→とき」に変換する場合は2、「とき→時」に変換する場合は1、変換しない場合は0を、「回答:」に続けて数字のみで出力してください。
 
-def analyze_toki(original_rpr, syntax_log_file, combined_text):
-    """
-    テキスト結合を行なったcombined_text全体に対して「時」と「とき」の検知を行い、文脈に応じて適切に変換する関数。
-    LLMが0を返した場合は処理を行わない。
-    """
-    modified_text = combined_text  # まず、combined_textをそのままmodified_textにコピー
-    highlighted_runs = []
+        回答:"""
 
-    # テキスト全体に対して「時」または「とき」を検索
-    if "時" in combined_text or "とき" in combined_text:
-        # LLMで文脈に応じた変換を行う
-        prompt = f"""
+    prompt = f"""
         次のテキストに含まれる「時」と「とき」の使い分けを判断してください。
-        テキスト: {combined_text}
+        テキスト: {text}
 
         次のルールに従って使い分けを判断してください:
         単独で用いられる「時」や「とき」という語を検出した場合、そのまま「場合」と言い換えても自然な文章が成立するのであれば「とき」が正しい用法です。
@@ -232,128 +262,448 @@ def analyze_toki(original_rpr, syntax_log_file, combined_text):
         ----------------------------------------------------------------------------
         では「思考：」に続けてステップバイステップで考察し、「回答:」に続けて考察に紐付く数字を出力してください。
         """
+    return prompt
 
-        # プロンプトの長さを計算
-        prompt_length = len(prompt)
+def parse_toki_answer(result):
+    """
+    LLMの出力から「回答:」に続く数字を取り出す関数。見つからない場合はNoneを返す
+    """
+    # 回答部分を取り出すための正規表現
+    answer_pattern = r'(?<![「（])回答:\s*(\d)'
 
-        # LLM の出力を取得
-        result = llm(prompt, temperature=0)
+    # 回答部分を抽出
+    answer_match = re.findall(answer_pattern, result)
+    return answer_match[-1] if answer_match else None
 
-        # プロンプト部分を除いた LLM の生成部分だけを取得
-        generated_text = result[prompt_length:]
-        
-        # 回答部分を取り出すための正規表現
-        answer_pattern = r'(?<![「（])回答:\s*(\d)'
+def judge_toki_llm(text, syntax_log_file, timeout=None):
+    """
+    LLMで文脈に応じた「時」と「とき」の使い分けを判定する関数
+    判定結果（"0"、"1"、"2"、判定できない場合はNone）を返す
+    timeout秒で生成を打ち切り（transformersのmax_time）、回答が得られなかった場合はTimeoutErrorとする
+    """
+    prompt = build_toki_prompt(text)
+
+    # プロンプトの長さを計算
+    prompt_length = len(prompt)
+
+    # LLM の出力を取得
+    # HuggingFacePipelineは作成時に渡したpipeline_kwargsを生成時に使用しないため、呼び出しごとに渡す
+    llm = get_llm()
+    pipeline_kwargs = dict(llm.pipeline_kwargs)
+    if timeout is not None:
+        pipeline_kwargs["max_time"] = timeout
+    start = time.perf_counter()
+    result = llm(prompt, temperature=0, pipeline_kwargs=pipeline_kwargs)
+    elapsed = time.perf_counter() - start
+
+    # プロンプト部分を除いた LLM の生成部分だけを取得
+    generated_text = result[prompt_length:]
+    
+    # 回答部分を抽出
+    answer = parse_toki_answer(result)
+
+    # プロンプトの回答例にも「回答:」が含まれるため、打ち切りの判断は生成部分に回答があるかどうかで行う
+    if timeout is not None and elapsed >= timeout and parse_toki_answer(generated_text) is None:
+        # 制限時間で打ち切られた場合は、判定結果を学習データに含めないよう判定結果の行を出力しない
+        syntax_log_file.write(f"-"*50+"\n")
+        syntax_log_file.write(f"LLMによる思考（打ち切り）: {generated_text}\n")
+        raise TimeoutError(f"LLMの呼び出しが制限時間（{timeout:.1f}秒）を超過")
+
+    # LLM判定結果をログファイルに書き出し
+    syntax_log_file.write(f"-"*50+"\n")
+    syntax_log_file.write(f"LLMによる思考: {generated_text}\n")
+    syntax_log_file.write(f"LLMによる判定結果: {answer}\n")
+    syntax_log_file.write(f"対象テキスト: {text}\n")
 
-        # 回答部分を抽出
-        answer_match = re.findall(answer_pattern, result)
-        answer = answer_match[-1] if answer_match else None
+    return answer
 
-        # LLM判定結果をログファイルに書き出し
+def judge_toki_llm_within(budget, text, syntax_log_file):
+    """
+    制限時間の範囲内でLLMによる判定を行う関数
+    文書の制限時間を超えている場合、またはLLMの呼び出しが制限時間を超えた場合はTimeoutErrorとする
+    """
+    if budget is None:
+        return judge_toki_llm(text, syntax_log_file)
+    if budget.expired():
+        raise TimeoutError("文書の制限時間を超過")
+    return judge_toki_llm(text, syntax_log_file, budget.next_timeout())
+
+def judge_toki_cascade(text, syntax_log_file, confidence_threshold, budget=None):
+    """
+    MeCab・spaCyの解析結果によるルールベースの判定を先に行い、
+    確信度がconfidence_threshold未満の文だけをLLMで判定する関数
+    budgetの制限時間はLLMによる判定のみに適用する（ルールベースで判定できる文は制限時間を超えた後も判定する）
+    判定順を決める際にルールベースで判定ずみの文は、その結果を使用する（構文解析を繰り返さない）
+    """
+    if budget is not None and text in budget.rule_verdicts:
+        answer, confidence, reason = budget.rule_verdicts[text]
+    else:
+        answer, confidence, reason = judge_toki_rule_text(text)
+
+    if answer is not None and confidence >= confidence_threshold:
+        toki_tier_counts["rule"] += 1
         syntax_log_file.write(f"-"*50+"\n")
-        syntax_log_file.write(f"LLMによる思考: {generated_text}\n")
-        syntax_log_file.write(f"LLMによる判定結果: {answer}\n")
-        syntax_log_file.write(f"対象テキスト: {combined_text}\n")
+        syntax_log_file.write(f"ルールによる判定結果: {answer}（確信度: {confidence:.2f}, 根拠: {reason}）\n")
+        syntax_log_file.write(f"対象テキスト: {text}\n")
+        return answer
+
+    answer = judge_toki_llm_within(budget, text, syntax_log_file)
+    toki_tier_counts["llm"] += 1  # 制限時間を超えた場合は代替判定として数える
+    return answer
+
+def judge_toki_classifier(text, syntax_log_file):
+    """
+    LLMの判定結果から学習した軽量分類器で「時」と「とき」の使い分けを判定する関数
+    CPUのみで動作し、LLMと同じ形式の判定結果を返す
+    """
+    toki_tier_counts["classifier"] += 1
+    answer, probability = toki_classifier.predict_toki(text)
+
+    syntax_log_file.write(f"-"*50+"\n")
+    syntax_log_file.write(f"分類器による判定結果: {answer}（確率: {probability:.2f}）\n")
+    syntax_log_file.write(f"対象テキスト: {text}\n")
 
-        # LLMの結果に基づいて変換を行う
+    return answer
+
+def judge_toki(text, syntax_log_file, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD, budget=None):
+    """
+    toki_backendに応じた方法で「時」と「とき」の使い分けを判定する関数
+    """
+    if toki_backend == "cascade":
+        return judge_toki_cascade(text, syntax_log_file, confidence_threshold, budget)
+    if toki_backend == "classifier":
+        return judge_toki_classifier(text, syntax_log_file)
+    answer = judge_toki_llm_within(budget, text, syntax_log_file)
+    toki_tier_counts["llm"] += 1  # 制限時間を超えた場合は代替判定として数える
+    return answer
+
+def judge_toki_within(budget, text, syntax_log_file, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD):
+    """
+    制限時間の範囲内で「時」と「とき」の使い分けを判定する関数
+    (判定結果, 制限時間を超えた場合はその理由) を返す
+    """
+    try:
+        return judge_toki(text, syntax_log_file, toki_backend, confidence_threshold, budget), None
+    except TimeoutError as e:
+        return None, str(e)
+
+def judge_toki_fallback(text, syntax_log_file, reason, toki_tokens):
+    """
+    LLMの制限時間を超えた文を、process.py の構文解析（analyze_toki）で判定する関数
+    変換するのはgate_tokiで検出した単独の「時」「とき」（toki_tokens）のみとする
+    確信度が低いことを示すため、変換箇所はFALLBACK_COLORでハイライトする
+    """
+    toki_tier_counts["fallback"] += 1
+    syntax_log_file.write(f"-"*50+"\n")
+    syntax_log_file.write(f"構文解析による代替判定（{reason}）\n")
+    doc = nlp(text)
+    _, edits = process.analyze_toki(doc, None, syntax_log_file, text, text)
+    converted_starts = set(start for start, _, _, _ in edits)
+    modified_text, edits = replace_toki_tokens(text, [token for token in toki_tokens if token.start in converted_starts], "時", "とき", FALLBACK_COLOR)
+    syntax_log_file.write(f"対象テキスト: {text}\n")
+    syntax_log_file.write(f"変換後のテキスト: {modified_text}\n")
+    return modified_text, edits
+
+def replace_toki_tokens(text, toki_tokens, original_text, replacement, color):
+    """
+    gate_tokiで検出した単独の「時」「とき」のうち、表層形がoriginal_textのトークンのみをreplacementに置き換える関数
+    「時間」「15時」「ときどき」などの他の語に含まれる文字は変換しない
+    (変換後のテキスト, text上の変換箇所 [(開始位置, 終了位置, 置き換える文字列, ハイライト色), ...]) を返す
+    """
+    modified_parts = []
+    edits = []
+    current_position = 0
+    for token in toki_tokens:
+        if token.surface == original_text:
+            modified_parts.append(text[current_position:token.start] + replacement)
+            edits.append((token.start, token.end, replacement, color))
+            current_position = token.end
+    modified_parts.append(text[current_position:])
+    return "".join(modified_parts), edits
+
+def analyze_toki(original_rpr, syntax_log_file, combined_text, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD, budget=None):
+    """
+    テキスト結合を行なったcombined_text全体に対して「時」と「とき」の検知を行い、文脈に応じて適切に変換する関数。
+    toki_backendが"llm"の場合はすべてLLMで判定し、"cascade"の場合はルールベースで判定できない文のみLLMで判定する。
+    "classifier"の場合はLLMの判定結果から学習した分類器で判定する。
+    budgetを指定した場合、制限時間を超えた文は process.py の構文解析で判定する。
+    判定結果が0の場合は処理を行わない。
+    (変換後のテキスト, combined_text上の変換箇所) を返す
+    """
+    modified_text = combined_text  # まず、combined_textをそのままmodified_textにコピー
+    edits = []
+
+    # テキスト全体に対して「時」または「とき」を検索
+    if "時" in combined_text or "とき" in combined_text:
+        # 形態素解析で単独の「時」「とき」がない文は判定を省略
+        toki_tokens, skip_reason = gate_toki(combined_text)
+
+        if not toki_tokens:
+            toki_tier_counts["gate"] += 1
+            syntax_log_file.write(f"-"*50+"\n")
+            syntax_log_file.write(f"判定を省略: {skip_reason}\n")
+            syntax_log_file.write(f"対象テキスト: {combined_text}\n")
+            return modified_text, edits
+
+        if budget is not None and combined_text in budget.judgments:
+            # 文書の処理前に判定ずみの文
+            answer, judged_log, fallback_reason = budget.judgments[combined_text]
+            syntax_log_file.write(judged_log)
+        else:
+            answer, fallback_reason = judge_toki_within(budget, combined_text, syntax_log_file, toki_backend, confidence_threshold)
+
+        if fallback_reason is not None:
+            return judge_toki_fallback(combined_text, syntax_log_file, fallback_reason, toki_tokens)
+
+        # 判定結果に基づいて変換を行う
         if answer == "1":
             # 「とき -> 時」の変換
-            modified_text = combined_text.replace("とき", "時")
-            highlighted_runs.append(("とき", "時", "red"))
+            modified_text, edits = replace_toki_tokens(combined_text, toki_tokens, "とき", "時", "red")
             syntax_log_file.write(f"変換: とき -> 時\n")
             syntax_log_file.write(f"変換後のテキスト: {modified_text}\n")
         elif answer == "2":
             # 「時 -> とき」の変換
-            modified_text = combined_text.replace("時", "とき")
-            highlighted_runs.append(("時", "とき", "red"))
+            modified_text, edits = replace_toki_tokens(combined_text, toki_tokens, "時", "とき", "red")
             syntax_log_file.write(f"変換: 時 -> とき\n")
             syntax_log_file.write(f"変換後のテキスト: {modified_text}\n")
         elif answer == "0":
-            # LLMが0を返した場合は処理を行わない
+            # 0を返した場合は処理を行わない
             syntax_log_file.write(f"変換なし \n")
             syntax_log_file.write(f"変換後のテキスト: {modified_text}（変更なし）\n")
         else:
             syntax_log_file.write(f"うまく判定できませんでした。 \n")
 
-    return modified_text, highlighted_runs
+    return modified_text, edits
 
-def split_and_highlight_text_element(text_element, log_file, syntax_log_file):
+def judge_toki_rule_text(text):
     """
-    該当する<w:t>要素を切り分け、キーワードを含む部分にハイライトを追加する関数
+    テキストを構文解析し、ルールベースで判定した (判定結果, 確信度, 根拠) を返す関数
     """
-    parent_run = text_element.getparent()
-    original_rpr = parent_run.find('.//w:rPr', namespaces)  # 元の<w:rPr>情報を取得
-    
-    # 親要素の<w:t>要素を結合して1つのテキストにする
-    combined_text = "".join([t.text for t in parent_run.findall('.//w:t', namespaces) if t.text])
-    
-    # テキスト全体を形態素解析で変換
-    modified_text, highlighted_runs_mecab = analyze_hoka(combined_text, log_file)
+    return judge_toki_rule(nlp(text), process.build_pronunciation_map(text))
 
-    # 変換されたテキストでLLMによる判定を実行
-    syntactically_modified_text, highlighted_runs_spacy = analyze_toki(original_rpr, syntax_log_file, combined_text)
+def toki_ambiguity(rule_verdict):
+    """
+    ルールベースの判定結果から、判定の難しさを返す関数。値が小さいほど判定が難しい（判定が分かれた場合は0）
+    """
+    answer, confidence, _ = rule_verdict
+    return confidence if answer is not None else 0.0
 
-    # ハイライトとテキストの置き換え処理
-    new_elements = []
-    highlighted_runs = highlighted_runs_mecab + highlighted_runs_spacy
-    current_position = 0
-    
-    # 元のテキストのどの位置まで処理されたかを記録
-    for original_text, modified_text, color in highlighted_runs:
-        index = syntactically_modified_text.find(modified_text, current_position)
-        if index == -1:
-            continue
+def plan_toki_judgments(prepared_runs, budget, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD):
+    """
+    文書内の判定対象の文をルールベースの確信度が低い順（判定が難しい順）に並べ、制限時間の範囲内で判定する関数
+    制限時間を先に判定が難しい文に使い、残りの文は process.py の構文解析で判定されるようにする
+    toki_backendが"cascade"の場合、ルールベースで判定できる文は制限時間を超えた後もルールベースで判定する
+    判定結果とログはbudget.judgmentsに保持し、xmlへの反映時に文書の順でログに書き出す
+    判定順を決めるためのルールベースの判定結果はbudget.rule_verdictsに保持し、カスケード判定で再利用する
+    """
+    candidates = []
+    seen_texts = set()
+    for _, _, hoka_results in prepared_runs:
+        for _, modified_text, _, _ in hoka_results:
+            if ("時" in modified_text or "とき" in modified_text) and modified_text not in seen_texts:
+                seen_texts.add(modified_text)
+                if gate_toki(modified_text)[0]:
+                    candidates.append(modified_text)
+
+    for text in candidates:
+        budget.rule_verdicts[text] = judge_toki_rule_text(text)
+    candidates.sort(key=lambda text: toki_ambiguity(budget.rule_verdicts[text]))
+
+    # ここまでの形態素解析・構文解析の時間は、LLMによる判定の制限時間に含めない
+    budget.start()
+    for text in candidates:
+        judged_log = io.StringIO()
+        answer, fallback_reason = judge_toki_within(budget, text, judged_log, toki_backend, confidence_threshold)
+        budget.judgments[text] = (answer, judged_log.getvalue(), fallback_reason)
+
+def prepare_run(paragraph_index, run_index, combined_text, log_file):
+    """
+    <w:r>のテキストを文単位に分割し、形態素解析による変換までを行う関数
+    LLMによる判定の前段の処理で、(段落番号, <w:r>番号, [(文, 変換後のテキスト, 「他」「外」の変換箇所, 各文字の文内の位置), ...]) を返す
+    """
+    # 文単位に分割し、文ごとに形態素解析で変換
+    hoka_results = [(unit, *process.analyze_hoka(unit.text, log_file)) for unit in split_sentences(combined_text)]
 
-        # ハイライトされない部分を追加
-        if current_position < index:
-            unhighlighted_text = syntactically_modified_text[current_position:index]
-            if unhighlighted_text:
-                new_elements.append(create_plain_run(original_rpr, unhighlighted_text))
+    return paragraph_index, run_index, hoka_results
 
-        # ハイライトされた部分を追加
-        new_elements.append(create_highlight(original_rpr, modified_text, color))
-        current_position = index + len(modified_text)
+def judge_run(prepared_run, syntax_log_file, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD, budget=None):
+    """
+    prepare_runの結果に対して文ごとに「時」「とき」の判定を行う関数
+    LLMに渡すプロンプトの長さを文単位に抑え、(段落番号, <w:r>番号, <w:r>内のテキスト上の変換箇所) を返す
+    """
+    paragraph_index, run_index, hoka_results = prepared_run
 
-    # 残りの部分を追加
-    if current_position < len(syntactically_modified_text):
-        remaining_text = syntactically_modified_text[current_position:]
-        new_elements.append(create_plain_run(original_rpr, remaining_text))
+    edits = []
+    for unit, modified_text, edits_mecab, positions in hoka_results:
+        # 変換されたテキストでLLMによる判定を実行
+        _, edits_llm = analyze_toki(None, syntax_log_file, modified_text, toki_backend, confidence_threshold, budget)
+        # LLMの変換箇所は「他」「外」を変換したテキスト上の位置のため、元のテキスト上の位置に直す
+        edits.extend(map_edits(edits_mecab, range(len(unit.text)), unit.start) + map_edits(edits_llm, positions, unit.start))
 
-    # 元の要素を削除して新しい要素を追加
-    parent = parent_run.getparent()
-    for new_element in new_elements:
-        parent.insert(parent.index(parent_run), new_element)
-    parent.remove(parent_run)
+    return paragraph_index, run_index, edits
 
-def process_xml(xml_file, log_filename, syntax_log_filename):
+def put_until_stopped(stage_queue, item, stop_event):
+    """
+    キューに空きができるまで待って要素を追加する関数。他の段階でエラーが発生した場合は追加せずに終了する
+    """
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def extract_stage(xml_file, log_file, prepared_queue, stop_event, errors):
+    """
+    パイプラインの抽出段階：xmlから処理対象の<w:r>を取り出し、形態素解析まで行ってキューに送る
+    """
+    try:
+        for paragraph_index, run_index, combined_text in process.iter_target_runs(xml_file):
+            if not put_until_stopped(prepared_queue, prepare_run(paragraph_index, run_index, combined_text, log_file), stop_event):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        put_until_stopped(prepared_queue, PIPELINE_END, stop_event)
+
+def inference_stage(prepared_queue, judged_queue, syntax_log_file, toki_backend, confidence_threshold, budget, stop_event, errors, timings):
+    """
+    パイプラインの推論段階：形態素解析ずみの<w:r>を受け取り、「時」「とき」の判定を行ってキューに送る
+    """
+    try:
+        while not stop_event.is_set():
+            try:
+                prepared_run = prepared_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if prepared_run is PIPELINE_END:
+                break
+
+            start = time.perf_counter()
+            judged_run = judge_run(prepared_run, syntax_log_file, toki_backend, confidence_threshold, budget)
+            timings["inference"] += time.perf_counter() - start
+
+            if not put_until_stopped(judged_queue, judged_run, stop_event):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        put_until_stopped(judged_queue, PIPELINE_END, stop_event)
+
+def run_pipeline(xml_file, log_file, syntax_log_file, edit_log, toki_backend, confidence_threshold, budget=None, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    抽出（xml走査・形態素解析）、推論（LLMによる判定）、書き込み（編集ログへの記録）の各段階を並行して実行する関数
+    段階間は上限つきのキューでつなぎ、推論が追いつかない場合は抽出を待たせることでメモリ使用量を抑える
+    ログファイルは段階ごとに書き込み元が1つに限られるため、出力の順序は逐次処理と同じになる
+    """
+    prepared_queue = queue.Queue(maxsize=queue_size)
+    judged_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+    timings = Counter()
+
+    start = time.perf_counter()
+    stages = [
+        threading.Thread(target=extract_stage, args=(xml_file, log_file, prepared_queue, stop_event, errors), daemon=True),
+        threading.Thread(target=inference_stage, args=(prepared_queue, judged_queue, syntax_log_file, toki_backend, confidence_threshold, budget, stop_event, errors, timings), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # 書き込み段階はメインスレッドで実行する。変換箇所は文書の順に届くため、そのまま編集ログに追加する
+    try:
+        while True:
+            try:
+                judged_run = judged_queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    break
+                continue
+            if judged_run is PIPELINE_END:
+                break
+            edit_log.add_run(*judged_run)
+    except BaseException:
+        stop_event.set()
+        raise
+    finally:
+        for stage in stages:
+            stage.join()
+
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start
+    print(f"処理時間: {elapsed:.1f}秒（うち判定: {timings['inference']:.1f}秒）")
+
+def report_toki_tiers():
+    """
+    「時」「とき」を含む文が各段階（形態素解析、ルールベース、分類器、LLM、構文解析による代替判定）で判定された件数と割合を文字列にまとめる関数
+    """
+    total = sum(toki_tier_counts.values())
+    report = "="*50 + "\n"
+    report += f"「時」「とき」を含む文: {total}件\n"
+    for tier, label in [("gate", "形態素解析で対象外"), ("rule", "ルールベースで判定"), ("classifier", "分類器で判定"), ("llm", "LLMで判定"), ("fallback", "制限時間超過で構文解析により判定")]:
+        count = toki_tier_counts[tier]
+        ratio = count / total if total else 0.0
+        report += f"{label}: {count}件 ({ratio:.1%})\n"
+    return report
+
+def process_xml(xml_file, log_filename, syntax_log_filename, toki_backend="llm", confidence_threshold=CONFIDENCE_THRESHOLD, pipelined=True,
+                deadline=DOCUMENT_DEADLINE, call_timeout=LLM_CALL_TIMEOUT, edit_log_filename=None, dataset_filename=None):
     """
     xmlからテキストを取得し、対象文字列（「他」、「外」、「時」、「とき」）を検索
     変換条件に一致する場合は変換を行い、ハイライトを付与
+    toki_backendに"cascade"を指定すると、確信度の低い文のみLLMで判定する
+    toki_backendに"classifier"を指定すると、LLMを使用せず学習済みの分類器で判定する
+    pipelinedがTrueの場合は、形態素解析・LLMによる判定・編集ログへの記録を並行して実行する
+    deadline（秒）を指定すると、判定が難しい文から順にLLMで判定し、制限時間を超えた後の文は process.py の構文解析で判定する
+    call_timeout（秒）を指定すると、LLMの1回の呼び出しが制限時間を超えた文も同様に構文解析で判定する
+    解析の段階ではxmlを書き換えずに変換箇所を編集ログ（edit_log.py）に記録し、xmlの書き出し時にまとめて反映する
+    edit_log_filenameを指定すると編集ログを保存する（python edit_log.py でハイライト色を変えて作り直せる）
+    dataset_filenameを指定すると、LLMの判定結果を分類器の学習データ（toki_classifier.py）に追記する
     """
-    keyword_count = 0   # 処理対象となった要素をカウント
-    processed_elements = []  # 処理対象の要素を格納するリスト
+    edit_log = EditLog()
 
     # ログファイルを開く
     with open(log_filename, 'w', encoding='utf-8') as log_file, open(syntax_log_filename, 'w', encoding='utf-8') as syntax_log_file:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+        toki_tier_counts.clear()
+
+        # 分類器はLLMを使用しないため、制限時間を設けない
+        budget = None
+        if toki_backend != "classifier" and (deadline is not None or call_timeout is not None):
+            budget = TokiBudget(deadline, call_timeout)
+
+        if budget is not None and deadline is not None:
+            # 文書全体の判定対象の文を先に集め、判定が難しい文から制限時間を割り当てる
+            prepared_runs = [prepare_run(*target_run, log_file) for target_run in process.iter_target_runs(xml_file)]
+            plan_toki_judgments(prepared_runs, budget, toki_backend, confidence_threshold)
+            for prepared_run in prepared_runs:
+                edit_log.add_run(*judge_run(prepared_run, syntax_log_file, toki_backend, confidence_threshold, budget))
+        elif pipelined:
+            run_pipeline(xml_file, log_file, syntax_log_file, edit_log, toki_backend, confidence_threshold, budget)
+        else:
+            # キーワードを含む<w:r>ごとに判定し、変換箇所を編集ログに記録
+            for target_run in process.iter_target_runs(xml_file):
+                edit_log.add_run(*judge_run(prepare_run(*target_run, log_file), syntax_log_file, toki_backend, confidence_threshold, budget))
 
-        for paragraph in root.findall('.//w:p', namespaces):
-            # <w:t>要素を取得
-            full_text = "".join(text_elem.text for text_elem in paragraph.findall('.//w:t', namespaces) if text_elem.text)
+        # 判定段階ごとの件数と割合をログファイルと標準出力に書き出し
+        report = report_toki_tiers()
+        syntax_log_file.write(report)
+        print(report)
 
-            # 処理対象の文字列を含むかチェック
-            if any(keyword in full_text for keyword in ["とき", "時", "他", "外"]):
-                keyword_count += 1  # カウントを増加(デバッグ用)
-                processed_elements.append(full_text)  # 処理対象の要素をリストに追加
+    if edit_log_filename:
+        edit_log.save(edit_log_filename)
 
-                # キーワードを含む<w:t>要素を切り分け、ハイライトを追加
-                for text_elem in paragraph.findall('.//w:t', namespaces):
-                    if text_elem.text:
-                        split_and_highlight_text_element(text_elem, log_file, syntax_log_file)  # 変換後にハイライトを適用
+    # 変換箇所を反映しながらxmlを書き出す
+    write_document(xml_file, xml_file, edit_log)
 
-    tree.write(xml_file, encoding='utf-8', xml_declaration=True, pretty_print=True)
+    # LLMの判定結果を分類器の学習データに追記
+    if dataset_filename and toki_tier_counts["llm"]:
+        toki_classifier.collect_verdicts([syntax_log_filename], dataset_filename)
 
 
 
-# process_xml('xml_new/word/document.xml', 'mecab_analysis_log.txt', 'judge_llm_log.txt')
\ No newline at end of file
+# process_xml('xml_new/word/document.xml', 'mecab_analysis_log.txt', 'judge_llm_log.txt')
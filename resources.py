@@ -0,0 +1,269 @@
+"""
+このファイルでは、実行環境で使用できるCPUコア数とメモリ量を調べ、各処理が使用するスレッド数・プロセス数をまとめて設定します。
+torch・spaCy（thincが使用するBLAS）・OpenMP・プロセスプールはそれぞれ独自にコア数分のスレッドを作成するため、
+1台のホストで複数の校閲処理を同時に実行すると、スレッド数がコア数を大きく上回り処理速度が低下する。
+
+・CPUコア数: プロセスに割り当てられたコア（sched_getaffinity）と、cgroupのCPU制限（コンテナの --cpus など）の小さい方
+・メモリ量: 空きメモリ（/proc/meminfo の MemAvailable）と、cgroupのメモリ制限から使用量を引いた値の小さい方
+・同時に実行中の校閲処理の数: 環境変数 YOUGO_CONCURRENT_JOBS、指定がなければ JOBS_DIR に登録されたプロセスの数
+
+他のモジュール（spacy、torchなど）を読み込む前に configure を呼び出すこと。
+BLAS・OpenMPのスレッド数は、ライブラリの読み込み時に環境変数から決まるため。
+"""
+
+import atexit
+import contextlib
+import fcntl
+import glob
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# 同時に実行中の校閲処理を登録するディレクトリ
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "yougo_check_jobs")
+
+# メモリを多く使用する処理（LLMの読み込みなど）を1つずつ実行するためのロックファイル
+ADMISSION_LOCK = os.path.join(tempfile.gettempdir(), "yougo_check_admission.lock")
+
+# 同時に実行中の校閲処理の数を指定する環境変数
+CONCURRENT_JOBS_ENV = "YOUGO_CONCURRENT_JOBS"
+
+# スレッド数を指定する環境変数（OpenMP、各BLAS実装、numexpr）
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+# メモリが空くのを待つ間隔（秒）
+ADMISSION_POLL_INTERVAL = 5.0
+
+# configure の結果
+# cores: 使用できるCPUコア数, memory_gb: 使用できるメモリ量, jobs: 同時に実行中の校閲処理の数
+# workers: プロセスプールのワーカー数, threads: 1プロセスあたりのスレッド数
+ResourcePlan = namedtuple("ResourcePlan", ["cores", "memory_gb", "jobs", "workers", "threads"])
+
+# 最後に configure で設定した内容
+plan = None
+
+
+def read_first_line(path):
+    """
+    ファイルの1行目を返す関数。ファイルがない場合はNoneを返す
+    """
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """
+    cgroupのCPU制限（コア数）を返す関数。制限がない場合はNoneを返す
+    cgroup v2 は cpu.max（「上限 周期」）、v1 は cpu.cfs_quota_us と cpu.cfs_period_us から求める
+    """
+    cpu_max = read_first_line("/sys/fs/cgroup/cpu.max")
+    if cpu_max is not None:
+        quota, period = cpu_max.split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+
+    quota = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota is not None and period is not None and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cores():
+    """
+    このプロセスが使用できるCPUコア数を返す関数
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cores = min(cores, max(1, int(limit)))
+    return cores
+
+
+def cgroup_memory_available():
+    """
+    cgroupのメモリ制限から現在の使用量を引いた値（バイト）を返す関数。制限がない場合はNoneを返す
+    """
+    for limit_path, usage_path in [
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ]:
+        limit = read_first_line(limit_path)
+        usage = read_first_line(usage_path)
+        if limit is None or usage is None:
+            continue
+        # 制限がない場合、v2は"max"、v1は非常に大きな値になる
+        if limit == "max" or int(limit) >= 1 << 60:
+            return None
+        return int(limit) - int(usage)
+    return None
+
+
+def available_memory_gb():
+    """
+    このプロセスが新たに使用できるメモリ量（GB）を返す関数
+    """
+    available = None
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        available = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+    cgroup_available = cgroup_memory_available()
+    if cgroup_available is not None:
+        available = min(available, cgroup_available)
+    return available / 1024 ** 3
+
+
+def process_alive(pid):
+    """
+    プロセスが実行中かどうかを返す関数
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def register_job():
+    """
+    このプロセスを実行中の校閲処理として JOBS_DIR に登録し、登録されている処理の数を返す関数
+    終了したプロセスの登録は削除する。このプロセスの登録は終了時に削除する
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_file = os.path.join(JOBS_DIR, str(os.getpid()))
+    with open(job_file, "w"):
+        pass
+    atexit.register(unregister_job, job_file)
+
+    jobs = 0
+    for path in glob.glob(os.path.join(JOBS_DIR, "*")):
+        name = os.path.basename(path)
+        if name.isdigit() and process_alive(int(name)):
+            jobs += 1
+        else:
+            unregister_job(path)
+    return max(1, jobs)
+
+
+def unregister_job(job_file):
+    """
+    校閲処理の登録を削除する関数
+    """
+    try:
+        os.remove(job_file)
+    except OSError:
+        pass
+
+
+def set_thread_count(threads):
+    """
+    OpenMP・BLAS・torchのスレッド数を設定する関数
+    環境変数はこのプロセスで後から読み込むライブラリと、子プロセスに引き継がれる
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+    # 読み込み済みのtorchには直接設定する
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def configure(workers=1):
+    """
+    使用できるCPUコアを同時に実行中の校閲処理で分け合うように、プロセス数とスレッド数を設定する関数
+    workersには希望するプロセスプールのワーカー数を指定する（プロセスプールを使用しない場合は1）
+    ワーカー数は割り当てられたコア数以下とし、残りのコアを各プロセスのスレッドに割り当てる
+    """
+    global plan
+
+    cores = available_cores()
+    if os.environ.get(CONCURRENT_JOBS_ENV):
+        jobs = max(1, int(os.environ[CONCURRENT_JOBS_ENV]))
+        register_job()
+    else:
+        jobs = register_job()
+
+    share = max(1, cores // jobs)
+    workers = max(1, min(workers, share))
+    threads = max(1, share // workers)
+    set_thread_count(threads)
+
+    plan = ResourcePlan(cores, available_memory_gb(), jobs, workers, threads)
+    print(f"使用できるコア数: {cores}, 空きメモリ: {plan.memory_gb:.1f}GB, 同時に実行中の処理: {jobs}件 → ワーカー数: {workers}, スレッド数: {threads}")
+    return plan
+
+
+def available_gpu_memory_gb():
+    """
+    GPUの空きメモリ（GB）を返す関数。GPUを使用しない場合はNoneを返す
+    """
+    if "torch" not in sys.modules:
+        return None
+    torch = sys.modules["torch"]
+    if not torch.cuda.is_available():
+        return None
+    free, _ = torch.cuda.mem_get_info()
+    return free / 1024 ** 3
+
+
+def memory_fits(required_gb, use_gpu=False):
+    """
+    required_gbのメモリが空いているかどうかを判定し、(空いているかどうか, 不足している場合の理由) を返す関数
+    use_gpuがTrueの場合はGPUの空きメモリも確認する
+    """
+    memory_gb = available_memory_gb()
+    if memory_gb < required_gb:
+        return False, f"空きメモリ {memory_gb:.1f}GB"
+    if use_gpu:
+        gpu_memory_gb = available_gpu_memory_gb()
+        if gpu_memory_gb is not None and gpu_memory_gb < required_gb:
+            return False, f"GPUの空きメモリ {gpu_memory_gb:.1f}GB"
+    return True, None
+
+
+@contextlib.contextmanager
+def admit(required_gb, timeout=None, use_gpu=False):
+    """
+    メモリを多く使用する処理（LLMの読み込みなど）を、必要なメモリが空いている場合のみ実行させる関数
+    同じホストの校閲処理どうしで1つずつ実行し、空きメモリがrequired_gbに満たない間は待つ
+    timeout秒を超えても空かない場合はMemoryErrorとする
+
+        with admit(16.0):
+            model = load_model()
+    """
+    # 他の校閲処理が読み込み中の間は待つ（読み込みが終わるまで空きメモリが正しく減らないため）
+    with open(ADMISSION_LOCK, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            start = time.monotonic()
+            while True:
+                fits, reason = memory_fits(required_gb, use_gpu)
+                if fits:
+                    break
+                if timeout is not None and time.monotonic() - start >= timeout:
+                    raise MemoryError(f"必要なメモリ {required_gb:.1f}GB を確保できません（{reason}）")
+                print(f"メモリの空きを待っています（必要: {required_gb:.1f}GB, {reason}）")
+                time.sleep(ADMISSION_POLL_INTERVAL)
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
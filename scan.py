@@ -0,0 +1,192 @@
+"""
+このファイルでは、文書を書き換えずに用語誤り（「他」「外」「時」「とき」）の検出のみを行います。
+wordファイル内の document.xml を展開せずに段落ごとに読み込み、process.py と同じ判定条件で検出した箇所を
+(段落番号, 段落内の文字位置, 元の文字列, 修正案, 前後の文脈) の一覧として返す。
+xmlの書き換え・<w:r>の作成・wordファイルの再構成を行わないため、提出前の確認を高速に行える。
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+import fork_pool  # 読み込み済みのモデルを共有するプロセスプール
+from process import mecab, nlp, is_hoka, is_toki_conversion, build_pronunciation_map
+from sentence_split import split_sentences  # 文単位の処理単位に分割
+from mecab_tokens import tokenize  # 文字位置つきのトークン列による形態素解析
+from edit_log import iter_paragraph_runs  # 段落ごとの<w:r>のテキストの読み込み
+
+# wordファイル内の本文のパス
+DOCUMENT_XML = "word/document.xml"
+
+# 検出箇所の前後に含める文脈の文字数
+CONTEXT_CHARS = 20
+
+# 報告する項目
+REPORT_FIELDS = ["file", "paragraph", "offset", "original", "suggestion", "context"]
+
+
+def iter_paragraphs(source):
+    """
+    document.xmlを先頭から順に読み込み、処理対象の文字列（「他」、「外」、「時」、「とき」）を含む段落について
+    (段落番号, 段落のテキスト, [(段落内の文字位置, <w:r>内のテキスト), ...]) を返す関数
+    段落番号・<w:r>の順は process.py の編集ログ（edit_log.py の iter_paragraph_runs）と同じ
+    読み終えた段落は削除し、文書全体の木をメモリに保持しない
+    """
+    for paragraph_index, run_texts in iter_paragraph_runs(source):
+        runs = []
+        paragraph_text = ""
+        for run_text in run_texts:
+            runs.append((len(paragraph_text), run_text))
+            paragraph_text += run_text
+
+        if any(keyword in paragraph_text for keyword in ["とき", "時", "他", "外"]):
+            yield paragraph_index, paragraph_text, runs
+
+
+def make_finding(paragraph_index, paragraph_text, offset, original, suggestion):
+    """
+    検出箇所1件分の辞書を作成する関数
+    """
+    context = paragraph_text[max(0, offset - CONTEXT_CHARS):offset + len(original) + CONTEXT_CHARS]
+    return {
+        "paragraph": paragraph_index,
+        "offset": offset,
+        "original": original,
+        "suggestion": suggestion,
+        "context": context,
+    }
+
+
+def scan_hoka(unit_text, unit_offset):
+    """
+    文1つを形態素解析し、process.py の analyze_hoka と同じく「他」「外」を「ほか」に変換したテキストを作成する関数
+    (変換後のテキスト, 変換後のテキストの各文字に対応する段落内の文字位置, 「他」「外」の検出箇所) を返す
+    検出箇所は (段落内の文字位置, 元の文字列, 修正案) のリスト
+    """
+    modified_text = ""
+    positions = []
+    findings = []
+    for token in tokenize(mecab, unit_text):
+        offset = unit_offset + token.start
+        if is_hoka(token):
+            findings.append((offset, token.surface, "ほか"))
+            modified_text += "ほか"
+            positions.extend([offset, offset])  # 1文字が2文字に置き換わる
+        else:
+            modified_text += token.surface
+            positions.extend(range(offset, offset + len(token.surface)))
+    return modified_text, positions, findings
+
+
+def scan_toki_rule(doc, modified_text, positions):
+    """
+    「他」「外」を変換したテキストの構文解析結果から、process.py の analyze_toki と同じ条件で「時」を検出する関数
+    """
+    pronunciation_map = build_pronunciation_map(modified_text)  # 文字位置 -> 読み仮名
+    return [
+        (positions[token.idx], token.text, "とき")
+        for token in doc
+        if is_toki_conversion(token.text, pronunciation_map.get(token.idx, ""), token.dep_)
+    ]
+
+
+def scan_toki_judged(modified_text, positions, toki_backend):
+    """
+    process_llm.py の analyze_toki（LLM、カスケード、分類器）で判定し、変換される文字列の位置を返す関数
+    """
+    import process_llm  # LLMを使用する場合のみ読み込む
+
+    _, edits = process_llm.analyze_toki(None, io.StringIO(), modified_text, toki_backend)
+    return [(positions[start], modified_text[start:end], replacement) for start, end, replacement, _ in edits]
+
+
+def scan_document(source, toki_backend="rule"):
+    """
+    document.xml（ファイルパスまたはファイルオブジェクト）から用語誤りを検出し、段落番号・文字位置の順に並べて返す関数
+    toki_backendが"rule"の場合はprocess.pyと同じ構文解析で「時」を判定し、
+    "llm"、"cascade"、"classifier"の場合はprocess_llm.pyの同名の判定方法で「時」「とき」を判定する
+    """
+    findings = []
+
+    def iter_units():
+        # 文ごとに「他」「外」を検出し、「時」「とき」を判定する文のみを構文解析に渡す
+        for paragraph_index, paragraph_text, runs in iter_paragraphs(source):
+            for run_offset, run_text in runs:
+                for unit in split_sentences(run_text):
+                    modified_text, positions, hoka_findings = scan_hoka(unit.text, run_offset + unit.start)
+                    for offset, original, suggestion in hoka_findings:
+                        findings.append(make_finding(paragraph_index, paragraph_text, offset, original, suggestion))
+                    if "時" in modified_text or (toki_backend != "rule" and "とき" in modified_text):
+                        yield modified_text, (paragraph_index, paragraph_text, modified_text, positions)
+
+    if toki_backend == "rule":
+        # 構文解析は複数の文をまとめて実行する
+        for doc, (paragraph_index, paragraph_text, modified_text, positions) in nlp.pipe(iter_units(), as_tuples=True):
+            for offset, original, suggestion in scan_toki_rule(doc, modified_text, positions):
+                findings.append(make_finding(paragraph_index, paragraph_text, offset, original, suggestion))
+    else:
+        for modified_text, (paragraph_index, paragraph_text, _, positions) in iter_units():
+            for offset, original, suggestion in scan_toki_judged(modified_text, positions, toki_backend):
+                findings.append(make_finding(paragraph_index, paragraph_text, offset, original, suggestion))
+
+    findings.sort(key=lambda finding: (finding["paragraph"], finding["offset"]))
+    return findings
+
+
+def scan_file(path, toki_backend="rule"):
+    """
+    wordファイル（.docx）またはdocument.xmlから用語誤りを検出する関数
+    wordファイルは展開せず、zip内の document.xml を直接読み込む
+    """
+    if path.endswith(".docx"):
+        with zipfile.ZipFile(path) as docx, docx.open(DOCUMENT_XML) as source:
+            findings = scan_document(source, toki_backend)
+    else:
+        findings = scan_document(path, toki_backend)
+
+    for finding in findings:
+        finding["file"] = path
+    return findings
+
+
+def collect_paths(paths):
+    """
+    指定されたパスからwordファイルの一覧を作成する関数。ディレクトリの場合は直下の.docxファイルを対象とする
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".docx"))
+        else:
+            files.append(path)
+    return files
+
+
+def scan_files(paths, toki_backend="rule", workers=1):
+    """
+    複数のファイルから用語誤りを検出し、ファイルの順に結合して返す関数
+    workersが2以上の場合は、読み込み済みのMeCab・spaCyをforkで共有するプロセスでファイルごとに並列に処理する
+    """
+    if workers > 1 and len(paths) > 1:
+        executor = fork_pool.create_fork_pool(min(workers, len(paths)))
+        try:
+            results = list(executor.map(scan_file, paths, [toki_backend] * len(paths)))
+        finally:
+            fork_pool.release_fork_pool(executor)
+    else:
+        results = [scan_file(path, toki_backend) for path in paths]
+    return [finding for findings in results for finding in findings]
+
+
+def write_report(findings, output, report_format="json"):
+    """
+    検出結果をJSONまたはCSV形式で書き出す関数。outputはファイルオブジェクト
+    """
+    if report_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(findings)
+    else:
+        json.dump([{field: finding[field] for field in REPORT_FIELDS} for finding in findings], output, ensure_ascii=False, indent=1)
+        output.write("\n")
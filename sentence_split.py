@@ -0,0 +1,101 @@
+"""
+このファイルでは段落のテキストを文単位に分割し、形態素解析・構文解析・LLMの処理単位を作成します。
+長い条文などが1つの<w:r>や段落にまとまっている場合でも、1回の解析で扱う文字数が上限を超えないようにしている。
+"""
+
+from collections import namedtuple
+
+# 文末として扱う文字
+SENTENCE_END_CHARS = "。！？!?"
+
+# 改行は括弧の内外に関わらず区切りとして扱う
+LINE_BREAK_CHARS = "\n\r"
+
+# 括弧の対応（開き括弧 -> 閉じ括弧）。括弧内の「。」では文を区切らない
+BRACKET_PAIRS = {
+    "「": "」",
+    "『": "』",
+    "（": "）",
+    "(": ")",
+    "【": "】",
+    "［": "］",
+    "〔": "〕",
+    "《": "》",
+    "〈": "〉",
+}
+
+# 上限を超える文を分割する際に優先して区切る文字
+SOFT_BREAK_CHARS = "、，,；;"
+
+# 1つの処理単位の最大文字数
+MAX_UNIT_CHARS = 200
+
+# 処理単位。start, end は段落テキスト内の文字位置
+SentenceUnit = namedtuple("SentenceUnit", ["start", "end", "text"])
+
+
+def split_sentences(text, max_chars=MAX_UNIT_CHARS):
+    """
+    テキストを「。」「！」「？」と改行で文単位に分割し、SentenceUnitのリストを返す
+    括弧内の文末記号では区切らず、max_charsを超える文はさらに読点などで分割する
+    返り値の各単位のtextを順に結合すると元のテキストに一致する
+    """
+    units = []
+    closing_stack = []  # 対応待ちの閉じ括弧
+    start = 0
+    i = 0
+    length = len(text)
+
+    while i < length:
+        ch = text[i]
+        end = None
+
+        if ch in LINE_BREAK_CHARS:
+            # 改行が連続する場合はまとめて1つの区切りとする
+            end = i + 1
+            while end < length and text[end] in LINE_BREAK_CHARS:
+                end += 1
+            closing_stack = []
+        elif ch in BRACKET_PAIRS:
+            closing_stack.append(BRACKET_PAIRS[ch])
+        elif closing_stack and ch == closing_stack[-1]:
+            closing_stack.pop()
+        elif ch in SENTENCE_END_CHARS and not closing_stack:
+            # 「？！」のように文末記号が連続する場合はまとめて1文とする
+            end = i + 1
+            while end < length and text[end] in SENTENCE_END_CHARS:
+                end += 1
+
+        if end is not None:
+            units.extend(_cap_unit(text, start, end, max_chars))
+            start = end
+            i = end
+            continue
+        i += 1
+
+    # 文末記号で終わらない残りの部分
+    if start < length:
+        units.extend(_cap_unit(text, start, length, max_chars))
+
+    return units
+
+
+def _cap_unit(text, start, end, max_chars):
+    """
+    text[start:end] が max_chars を超える場合に、読点などの位置で分割する
+    区切りに適した文字がない場合は max_chars の位置で強制的に分割する
+    """
+    units = []
+    while end - start > max_chars:
+        window = text[start:start + max_chars]
+        cut = max(window.rfind(c) for c in SOFT_BREAK_CHARS)
+        if cut <= 0:
+            split_at = start + max_chars
+        else:
+            split_at = start + cut + 1
+        units.append(SentenceUnit(start, split_at, text[start:split_at]))
+        start = split_at
+
+    if start < end:
+        units.append(SentenceUnit(start, end, text[start:end]))
+    return units
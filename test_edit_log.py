@@ -0,0 +1,122 @@
+"""
+edit_log.py の編集ログの記録と document.xml の書き出しを確認するテスト
+テキストボックス（入れ子の段落）を含む文書で、変換箇所が欠落しないこと・テキストボックスが削除されないことを確認する
+
+実行方法:
+    python -m unittest test_edit_log
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from lxml import etree as ET  # lxmlを使用
+
+from edit_log import W, W_NAMESPACE, XML_SPACE, EditLog, iter_paragraph_runs, run_text, write_document
+
+# 段落0の中にテキストボックス（段落1）があり、その後に本文の段落2が続く文書
+NESTED_DOCUMENT = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="{W_NAMESPACE}" xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape"><w:body>
+<w:p><w:r><w:t>他の案</w:t></w:r><w:r><w:drawing><wps:wsp><wps:txbx><w:txbxContent><w:p><w:r><w:t>雨の時は休む</w:t></w:r></w:p></w:txbxContent></wps:txbx></wps:wsp></w:drawing></w:r><w:r><w:t>と外の案</w:t></w:r></w:p>
+<w:p><w:r><w:t>晴れた時は進む</w:t></w:r></w:p>
+</w:body></w:document>
+"""
+
+
+def paragraph_texts(path):
+    """
+    書き出した document.xml の各段落の (テキスト, ハイライトされたテキストのリスト) を文書の順に返す
+    """
+    root = ET.parse(path).getroot()
+    texts = []
+    for paragraph in root.iter(W + "p"):
+        runs = [run for run in paragraph.iter(W + "r") if next(run.iterancestors(W + "p")) is paragraph and run.find(".//" + W + "p") is None]
+        texts.append((
+            "".join(run_text(run) for run in runs),
+            [run_text(run) for run in runs if run.find(".//" + W + "highlight") is not None],
+        ))
+    return texts
+
+
+class NestedParagraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.work_dir, "document.xml")
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write(NESTED_DOCUMENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_paragraph_runs(self):
+        # テキストボックスの段落は外側の段落より先に返し、テキストボックスを含む<w:r>は外側の段落の<w:r>に含めない
+        self.assertEqual(list(iter_paragraph_runs(self.source)), [
+            (1, ["雨の時は休む"]),
+            (0, ["他の案", "と外の案"]),
+            (2, ["晴れた時は進む"]),
+        ])
+
+    def test_write_document(self):
+        # process.py と同じく、iter_paragraph_runs の順（段落番号の順ではない）に変換箇所を追加する
+        edit_log = EditLog()
+        edit_log.add_run(1, 0, [(2, 3, "とき", "red")])
+        edit_log.add_run(0, 0, [(0, 1, "ほか", "yellow")])
+        edit_log.add_run(0, 1, [(1, 2, "ほか", "yellow")])
+        edit_log.add_run(2, 0, [(3, 4, "とき", "red")])
+
+        output = os.path.join(self.work_dir, "output.xml")
+        write_document(self.source, output, edit_log)
+
+        self.assertEqual(paragraph_texts(output), [
+            ("ほかの案とほかの案", ["ほか", "ほか"]),
+            ("雨のときは休む", ["とき"]),
+            ("晴れたときは進む", ["とき"]),
+        ])
+        # テキストボックスが残っていること
+        self.assertEqual(len(ET.parse(output).getroot().findall(".//" + W + "txbxContent")), 1)
+
+    def test_saved_log(self):
+        # 保存した編集ログから、ハイライト色を変えて同じ文書を作り直せること
+        edit_log = EditLog()
+        edit_log.add_run(1, 0, [(2, 3, "とき", "red")])
+        edit_log.add_run(2, 0, [(3, 4, "とき", "red")])
+        log_path = os.path.join(self.work_dir, "edit_log.json")
+        edit_log.save(log_path)
+
+        output = os.path.join(self.work_dir, "output.xml")
+        write_document(self.source, output, EditLog.load(log_path), {"red": "magenta"})
+
+        root = ET.parse(output).getroot()
+        self.assertEqual([h.get(W + "val") for h in root.iter(W + "highlight")], ["magenta", "magenta"])
+
+
+class WhitespaceTest(unittest.TestCase):
+
+    def test_preserve_space(self):
+        # 切り分けた<w:t>の前後の空白がWordで取り除かれないよう、xml:space="preserve" を付与すること
+        work_dir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(work_dir, "document.xml")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(f'<w:document xmlns:w="{W_NAMESPACE}"><w:body><w:p><w:r><w:t xml:space="preserve">Ａ  B 他の  時は</w:t></w:r></w:p></w:body></w:document>')
+
+            edit_log = EditLog()
+            edit_log.add_run(0, 0, [(5, 6, "ほか", "yellow"), (9, 10, "とき", "red")])
+            output = os.path.join(work_dir, "output.xml")
+            write_document(source, output, edit_log)
+
+            texts = [(t.text, t.get(XML_SPACE)) for t in ET.parse(output).getroot().iter(W + "t")]
+            self.assertEqual(texts, [
+                ("Ａ  B ", "preserve"),
+                ("ほか", None),
+                ("の  ", "preserve"),
+                ("とき", None),
+                ("は", None),
+            ])
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+"""
+このファイルではLLMによる「時」「とき」の判定結果をログから収集し、軽量な分類器を学習します。
+学習した分類器はprocess_llm.pyの判定方法（toki_backend="classifier"）として、GPUを使用せずに利用できる。
+
+使い方:
+    # LLMの判定ログから学習データを収集（既存の学習データに追記）
+    python toki_classifier.py collect spacy_analysis_log.txt
+
+    # 学習データから分類器を学習し、LLMとの一致率を表示
+    python toki_classifier.py train
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pickle
+import re
+
+import MeCab  # MeCabを使用した形態素解析
+from mecab_tokens import tokenize  # 文字位置つきのトークン列による形態素解析
+
+# 学習データ（1行に1件、{"text": 対象テキスト, "label": 判定結果}）
+DATASET_PATH = "toki_dataset.jsonl"
+
+# 学習済み分類器の保存先
+CLASSIFIER_PATH = os.path.join("model", "toki_classifier.pkl")
+
+# 「時」「とき」の前後から切り出す文字数
+CONTEXT_WINDOW = 5
+
+# MeCabのトークナイザーを初期化
+mecab = MeCab.Tagger("-Ochasen")
+
+# 読み込み済みの分類器（初回の判定時に読み込む）
+classifier = None
+
+
+def collect_verdicts(log_paths, dataset_path=DATASET_PATH):
+    """
+    LLMの判定ログから「対象テキスト」と「LLMによる判定結果」の組を取り出し、学習データに追記する関数
+    同じテキストが既に学習データにある場合は新しい判定結果で上書きする
+    同時に実行中の校閲処理が追記した判定結果を失わないよう、読み込みから書き出しまでをファイルロックで排他する
+    """
+    with open(dataset_path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return merge_verdicts(log_paths, dataset_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def merge_verdicts(log_paths, dataset_path):
+    """
+    collect_verdicts の本体（ロックを取得した状態で呼び出す）
+    学習データは一時ファイルに書き出してから置き換え、書き出し中に読み込まれても壊れた内容を読まないようにする
+    """
+    samples = load_dataset(dataset_path)
+    added = 0
+
+    for log_path in log_paths:
+        with open(log_path, encoding='utf-8') as log_file:
+            answer = None
+            for line in log_file:
+                line = line.rstrip("\n")
+                if line.startswith("LLMによる判定結果: "):
+                    answer = line[len("LLMによる判定結果: "):].strip()
+                elif line.startswith("対象テキスト: ") and answer is not None:
+                    text = line[len("対象テキスト: "):]
+                    if answer in ["0", "1", "2"]:
+                        if text not in samples:
+                            added += 1
+                        samples[text] = answer
+                    answer = None
+
+    temp_path = dataset_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as dataset_file:
+        for text, label in samples.items():
+            dataset_file.write(json.dumps({"text": text, "label": label}, ensure_ascii=False) + "\n")
+    os.replace(temp_path, dataset_path)
+
+    print(f"{added}件の判定結果を {dataset_path} に追加しました（合計{len(samples)}件）。")
+    return samples
+
+
+def load_dataset(dataset_path=DATASET_PATH):
+    """
+    学習データを読み込み、テキストから判定結果を引く辞書を返す関数
+    """
+    samples = {}
+    if not os.path.exists(dataset_path):
+        return samples
+
+    with open(dataset_path, encoding='utf-8') as dataset_file:
+        for line in dataset_file:
+            if line.strip():
+                sample = json.loads(line)
+                samples[sample["text"]] = sample["label"]
+    return samples
+
+
+def extract_features(text):
+    """
+    テキストから分類器の入力となる特徴量を作成する関数
+    「時」「とき」の前後の文字列（文字n-gram用）と、MeCabの解析結果による特徴（表層形・読み・前後の品詞など）を返す
+    """
+    # 「時」「とき」の前後の文字列
+    contexts = []
+    for match in re.finditer("時|とき", text):
+        contexts.append(text[max(0, match.start() - CONTEXT_WINDOW):match.end() + CONTEXT_WINDOW])
+
+    # 形態素解析の結果
+    tokens = tokenize(mecab, text)
+
+    features = []
+    for i, token in enumerate(tokens):
+        if token.surface not in ["時", "とき"]:
+            continue
+        features.append(f"SURF={token.surface}")
+        features.append(f"READ={token.pronunciation}")
+        features.append(f"POS={token.pos}")
+        if i > 0:
+            features.append(f"PREV={tokens[i - 1].surface}")
+            features.append(f"PREV_POS={tokens[i - 1].pos}")
+        if i + 1 < len(tokens):
+            features.append(f"NEXT={tokens[i + 1].surface}")
+            features.append(f"NEXT_POS={tokens[i + 1].pos}")
+
+    # 「時間」「同時」などの複合語のみで、単独の「時」「とき」がない
+    if not features:
+        features.append("NO_STANDALONE")
+
+    return " ".join(contexts), " ".join(features)
+
+
+def build_matrix(model, texts, fit=False):
+    """
+    テキストのリストを分類器の入力行列に変換する関数
+    """
+    from scipy.sparse import hstack
+
+    contexts, features = zip(*[extract_features(text) for text in texts])
+    if fit:
+        return hstack([model["context_vectorizer"].fit_transform(contexts),
+                       model["feature_vectorizer"].fit_transform(features)]).tocsr()
+    return hstack([model["context_vectorizer"].transform(contexts),
+                   model["feature_vectorizer"].transform(features)]).tocsr()
+
+
+def new_model():
+    """
+    学習前の分類器（文字n-gram + MeCab特徴量のロジスティック回帰）を作成する関数
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    return {
+        "context_vectorizer": TfidfVectorizer(analyzer="char", ngram_range=(1, 3), sublinear_tf=True),
+        "feature_vectorizer": CountVectorizer(token_pattern=r"\S+", lowercase=False, binary=True),
+        "classifier": LogisticRegression(max_iter=1000, class_weight="balanced"),
+    }
+
+
+def train(dataset_path=DATASET_PATH, model_path=CLASSIFIER_PATH, test_size=0.2, seed=0):
+    """
+    学習データから分類器を学習する関数
+    学習データの一部を評価用に分けてLLMの判定結果との一致率を表示した後、全データで学習し直して保存する
+    """
+    from sklearn.metrics import accuracy_score, classification_report
+    from sklearn.model_selection import train_test_split
+
+    samples = load_dataset(dataset_path)
+    texts = list(samples.keys())
+    labels = list(samples.values())
+    if len(set(labels)) < 2:
+        raise ValueError(f"{dataset_path} の判定結果が1種類しかないため学習できません（{len(texts)}件）")
+
+    # 各判定結果が2件以上ある場合は判定結果の比率を保って分割する
+    stratify = labels if min(labels.count(label) for label in set(labels)) >= 2 else None
+    train_texts, test_texts, train_labels, test_labels = train_test_split(
+        texts, labels, test_size=test_size, random_state=seed, stratify=stratify)
+
+    # 評価用データでLLMとの一致率を測定
+    model = new_model()
+    model["classifier"].fit(build_matrix(model, train_texts, fit=True), train_labels)
+    predicted = model["classifier"].predict(build_matrix(model, test_texts))
+    agreement = accuracy_score(test_labels, predicted)
+    report = classification_report(test_labels, predicted, zero_division=0)
+    print(f"学習データ: {len(train_texts)}件, 評価データ: {len(test_texts)}件")
+    print(f"LLMとの一致率: {agreement:.3f}")
+    print(report)
+
+    # 全データで学習し直して保存
+    model = new_model()
+    model["classifier"].fit(build_matrix(model, texts, fit=True), labels)
+    model["metrics"] = {"agreement": agreement, "report": report, "samples": len(texts)}
+
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    with open(model_path, 'wb') as model_file:
+        pickle.dump(model, model_file)
+    print(f"分類器を {model_path} に保存しました。")
+    return model
+
+
+def load_classifier(model_path=CLASSIFIER_PATH):
+    """
+    学習済みの分類器を読み込む関数
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"{model_path} が見つかりません。python toki_classifier.py train で分類器を学習してください。")
+    with open(model_path, 'rb') as model_file:
+        return pickle.load(model_file)
+
+
+def predict_toki(text):
+    """
+    分類器で「時」と「とき」の使い分けを判定する関数
+    (判定結果, 確率) を返す。判定結果はLLMと同じく "0"、"1"、"2" のいずれか
+    """
+    global classifier
+    if classifier is None:
+        classifier = load_classifier()
+
+    probabilities = classifier["classifier"].predict_proba(build_matrix(classifier, [text]))[0]
+    best = probabilities.argmax()
+    return str(classifier["classifier"].classes_[best]), float(probabilities[best])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLMの判定ログから「時」「とき」の分類器を学習します。")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    collect_parser = subparsers.add_parser("collect", help="判定ログから学習データを収集")
+    collect_parser.add_argument("logs", nargs="+", help="LLMの判定ログ（spacy_analysis_log.txtなど）")
+    collect_parser.add_argument("--dataset", default=DATASET_PATH)
+
+    train_parser = subparsers.add_parser("train", help="学習データから分類器を学習")
+    train_parser.add_argument("--dataset", default=DATASET_PATH)
+    train_parser.add_argument("--model", default=CLASSIFIER_PATH)
+    train_parser.add_argument("--test-size", type=float, default=0.2)
+
+    args = parser.parse_args()
+    if args.command == "collect":
+        collect_verdicts(args.logs, args.dataset)
+    else:
+        train(args.dataset, args.model, args.test_size)
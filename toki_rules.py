@@ -0,0 +1,77 @@
+"""
+このファイルではMeCab・spaCyの解析結果から「時」と「とき」の使い分けをルールベースで判定します。
+判定結果には確信度を付与し、確信度の低い文だけをLLMによる判定に回すために用いる。
+判定結果の数字はLLMと同じく、0: 変換なし、1: とき→時、2: 時→とき とする。
+"""
+
+# 「時」「とき」の直後に続くと条件・状況を表す用法になりやすい語
+CONDITIONAL_FOLLOWERS = ["は", "に", "には", "にも", "も", "、", "，"]
+
+# 直前にあると連体修飾（「〜する時」）になる品詞
+MODIFIER_POS = ["VERB", "AUX", "ADJ"]
+
+
+def judge_toki_token(token, pronunciation):
+    """
+    spaCyのトークン1つについて「時」「とき」の判定を行う関数
+    (判定結果, 確信度, 根拠) を返す
+    """
+    surface = token.text
+    prev_token = token.nbor(-1) if token.i > 0 else None
+    next_token = token.nbor(1) if token.i + 1 < len(token.doc) else None
+
+    # 「15時」のように数字に続く「時」は時刻を表す
+    if surface == "時" and prev_token is not None and (prev_token.like_num or prev_token.pos_ == "NUM"):
+        return "0", 0.99, "数字に続く時刻の「時」"
+
+    # 「ジ」と読まれる「時」は「とき」との使い分けの対象外
+    if surface == "時" and pronunciation == "ジ":
+        return "0", 0.95, "読みが「ジ」"
+
+    modified = prev_token is not None and prev_token.pos_ in MODIFIER_POS
+    conditional = next_token is not None and next_token.text in CONDITIONAL_FOLLOWERS
+
+    if surface == "時":
+        if modified and conditional:
+            # 「〜する時は」「〜した時に」は「場合」と言い換えられる条件の用法
+            confidence = 0.9 if token.dep_ == "obl" else 0.8
+            if prev_token.text in ["た", "だ"]:
+                # 過去の特定の時点を指すこともあるため確信度を下げる
+                confidence -= 0.2
+            return "2", confidence, "連体修飾＋条件の助詞"
+        if prev_token is not None and prev_token.text == "の":
+            return "0", 0.5, "「〜の時」"
+        return "0", 0.6, "条件の用法に当てはまらない"
+
+    # 「とき」
+    if modified and conditional:
+        if prev_token.text in ["た", "だ"]:
+            return "0", 0.6, "過去の連体修飾＋「とき」"
+        return "0", 0.85, "連体修飾＋条件の助詞"
+    return "0", 0.5, "文脈の判断が必要な「とき」"
+
+
+def judge_toki_rule(doc, pronunciation_map):
+    """
+    文全体について「時」「とき」の判定を行う関数
+    文中のすべての「時」「とき」の判定をまとめ、(判定結果, 確信度, 根拠) を返す
+    pronunciation_mapはテキスト上の文字位置から読み仮名を引く辞書
+    判定するのは読みが「トキ」の単独の「時」「とき」のみとし、「15時」「時間」など変換の対象にならない語は判定に含めない
+    判定が食い違う場合は確信度を0とし、LLMによる判定に回す
+    """
+    verdicts = []
+    for token in doc:
+        pronunciation = pronunciation_map.get(token.idx, "")
+        if token.text in ["時", "とき"] and pronunciation == "トキ":
+            verdicts.append(judge_toki_token(token, pronunciation))
+
+    # 単独の「時」「とき」がない（「時間」「同時」などの複合語のみ）
+    if not verdicts:
+        return "0", 0.99, "単独の「時」「とき」なし"
+
+    answers = set(answer for answer, _, _ in verdicts)
+    if len(answers) > 1:
+        return None, 0.0, "判定の食い違い"
+
+    answer, confidence, reason = min(verdicts, key=lambda verdict: verdict[1])
+    return answer, confidence, reason